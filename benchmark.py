@@ -0,0 +1,895 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import fitz
+import numpy as np
+import pytesseract
+from openpyxl import load_workbook
+
+from factory_to_sheet_mc import load_config, ensure_tesseract_path, pdf_to_text, render_page_array, ocr_image
+from factory_to_sheet_mc import extract_text_data, load_exclude_set, process_folder_multiprocessing
+from factory_to_sheet_mc import page_to_text, join_page_texts
+from preprocess import preprocess_image, estimate_skew, rotate_image
+from number_regions import to_gray
+from spssp_mc_combine import get_images_from_folder, load_template_features
+from spssp_mc_combine import remove_blank_pages, compare_image_with_pdf_pages_multiprocessing
+from spssp_mc_combine import get_split_points, split_ranges, split_pdf, process_pdf_single_pass
+from spssp_mc_combine import prepare_stamp_view, compare_page_with_templates
+from spssp_mc_combine import MATCHER_DETECTORS, best_match_count, get_match_threshold
+"""
+效能量測工具
+python benchmark.py ocr-scaling            量測 pdf_to_text 隨頁數的耗時
+python benchmark.py ocr-scaling --render-only   只量測渲染（不需 Tesseract）
+python benchmark.py stamp-roi [--pdf 檔案 --region 0,0.5,1,1]  比較大印偵測整頁模式與搜尋區域模式
+python benchmark.py matchers [--pdf 檔案 --labels 3,8,12]  比較各比對方式的速度與正確率
+python benchmark.py ocr-backends [--pdf 檔案]  比較 pytesseract 與 tesserocr 每頁延遲
+python benchmark.py extract [--exclude 300000]  量測發文字號、工廠編號擷取的吞吐量
+python benchmark.py generate --out 樣本.pdf [--documents 20]  產生模擬掃描批次（含正確答案 .truth.json）
+python benchmark.py e2e [--pdf 樣本.pdf] [--save-baseline]  端到端量測各階段吞吐量與正確率，與基準比較
+python benchmark.py ocr-adaptive [--pdf 樣本.pdf]  比較固定 dpi 與自適應 OCR 的耗時、提高解析度頁數與正確率
+python benchmark.py preprocess [--max-skew 3]  量測前處理耗時、轉正後殘餘角度，及對 OCR 耗時與正確率的影響
+"""
+
+
+def make_raster_pdf(pdf_path, page_count, seed=0):
+    """建立無文字層的掃描頁 PDF（每頁一張灰階雜訊影像）"""
+    rng = np.random.default_rng(seed)
+    doc = fitz.open()
+    for _ in range(page_count):
+        page = doc.new_page()  # A4
+        img = rng.integers(200, 256, size=(842, 595), dtype=np.uint8)
+        pix = fitz.Pixmap(fitz.csGRAY, 595, 842, img.tobytes(), False)
+        page.insert_image(page.rect, pixmap=pix)
+    doc.save(pdf_path)
+    doc.close()
+
+
+def make_stamped_pdf(pdf_path, page_count, template_path, stamp_every=5, seed=0):
+    """建立掃描頁 PDF，每 stamp_every 頁在頁面下方蓋上模板圖片"""
+    rng = np.random.default_rng(seed)
+    doc = fitz.open()
+    for i in range(page_count):
+        page = doc.new_page()
+        img = rng.integers(215, 256, size=(842, 595), dtype=np.uint8)
+        pix = fitz.Pixmap(fitz.csGRAY, 595, 842, img.tobytes(), False)
+        page.insert_image(page.rect, pixmap=pix)
+        if (i + 1) % stamp_every == 0:
+            page.insert_image(fitz.Rect(150, 640, 450, 746), filename=template_path)
+    doc.save(pdf_path)
+    doc.close()
+
+
+def make_number_pdf(pdf_path, page_count, seed=0):
+    """建立有印刷數字（發文字號、工廠編號）的掃描頁 PDF"""
+    rng = np.random.default_rng(seed)
+    doc = fitz.open()
+    for _ in range(page_count):
+        img = np.full((1754, 1240), 255, dtype=np.uint8)  # A4 150 dpi
+        y = 200
+        for _ in range(12):
+            number = "".join(str(d) for d in rng.integers(0, 10, size=int(rng.choice([8, 10]))))
+            cv2.putText(img, number, (150, y), cv2.FONT_HERSHEY_SIMPLEX, 1.6, 0, 3, cv2.LINE_AA)
+            y += 110
+        page = doc.new_page()
+        page.insert_image(page.rect, pixmap=fitz.Pixmap(fitz.csGRAY, 1240, 1754, img.tobytes(), False))
+    doc.save(pdf_path)
+    doc.close()
+
+
+FILLER_LINES = [
+    "主旨：有關貴公司工廠登記事項變更一案，復如說明，請查照。",
+    "說明：一、依據工廠管理輔導法及相關規定辦理。",
+    "二、旨揭工廠登記資料業經本府審查完竣，准予備查。",
+    "三、請於期限內依規定辦理相關事項，逾期不予受理。",
+    "副本：經濟部產業發展署、本府經濟發展局。",
+    "中華民國一百一十三年十月十八日",
+]
+
+
+def render_text_page(lines, dpi, rng):
+    """以 PyMuPDF 排版文字後轉成灰階點陣（模擬掃描前的紙本）"""
+    doc = fitz.open()
+    page = doc.new_page()
+    y = 90
+    for line in lines:
+        page.insert_text((72 + rng.integers(-6, 7), y), line, fontname="china-t", fontsize=13)
+        y += 30 + int(rng.integers(0, 8))
+    img = render_page_array(page, dpi=dpi, gray=True)
+    doc.close()
+    return img
+
+
+def add_stamp(img, template, rng):
+    """把模板以隨機尺度、角度、位置蓋在頁面下方（相乘混合，模擬印泥）"""
+    height, width = img.shape[:2]
+    scale = rng.uniform(0.8, 1.2) * width / 1240 * 1.6
+    angle = rng.uniform(-4, 4)
+    stamp = cv2.resize(template, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    h, w = stamp.shape[:2]
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    stamp = cv2.warpAffine(stamp, matrix, (w, h), borderValue=(255, 255, 255))
+    x = int(rng.integers(0, max(1, width - w)))
+    y = int(rng.uniform(0.62, 0.9) * height - h / 2)
+    y = min(max(0, y), height - h)
+    region = img[y:y + h, x:x + w]
+    np.minimum(region, stamp, out=region)
+
+
+def scan_noise(img, rng, skew=True):
+    """掃描雜訊：輕微歪斜、紙張底色、灰塵點，回傳 JPEG 位元組"""
+    height, width = img.shape[:2]
+    if skew:
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), rng.uniform(-0.8, 0.8), 1.0)
+        img = cv2.warpAffine(img, matrix, (width, height), borderValue=(255, 255, 255))
+    img = img.astype(np.int16)
+    mask = rng.random(img.shape[:2]) < 0.004
+    img[mask] -= rng.integers(3, 12, size=(int(mask.sum()), 1) if img.ndim == 3 else int(mask.sum()),
+                              dtype=np.int16)
+    for _ in range(int(rng.integers(0, 12))):
+        cy, cx = int(rng.integers(0, height)), int(rng.integers(0, width))
+        img[max(0, cy - 1):cy + 2, max(0, cx - 1):cx + 2] = rng.integers(60, 180)
+    img = np.clip(img, 0, 255).astype(np.uint8)
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)  # imencode 使用 BGR
+    ok, data = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return data.tobytes()
+
+
+def blank_scan(width, height, rng, near_blank=False):
+    """空白頁：純白加雜訊；near_blank 時加上淡淡的透印"""
+    img = np.full((height, width), 255, dtype=np.uint8)
+    if near_blank:
+        x0, y0 = int(rng.integers(0, width // 2)), int(rng.integers(0, height // 2))
+        cv2.rectangle(img, (x0, y0), (x0 + width // 4, y0 + height // 20), 246, -1)
+    return scan_noise(img, rng, skew=False)
+
+
+def random_factory_number(rng, exclude_set):
+    while True:
+        if rng.random() < 0.2:
+            number = "S" + "".join(str(d) for d in rng.integers(0, 10, size=7))
+        else:
+            number = "".join(str(d) for d in rng.integers(0, 10, size=8))
+        if number not in exclude_set:
+            return number
+
+
+def make_scanned_batch(pdf_path, template_paths, document_count=20, seed=0, dpi=150, exclude_set=frozenset(),
+                       gray_every=4):
+    """
+    產生模擬掃描批次：無文字層的點陣頁、空白／近空白頁、最後一頁蓋有 footer_images 模板。
+
+    每份文件 1～4 頁，第一頁有 10 碼發文字號與 1～3 個工廠編號（8 碼或 S 開頭 7 碼）。
+    每 gray_every 份文件有一份以灰階掃描（單通道 JPEG，大印也是灰階），其餘為彩色掃描。
+    正確答案另存為 <pdf_path>.truth.json。
+
+    Returns:
+        dict: page_count, blank_pages（從 1 開始）, stamp_pages（從 0 開始）, documents
+    """
+    rng = np.random.default_rng(seed)
+    templates = [cv2.imread(path, cv2.IMREAD_COLOR) for path in template_paths]
+    templates = [cv2.cvtColor(t, cv2.COLOR_BGR2RGB) for t in templates if t is not None]
+    width, height = int(595 * dpi / 72), int(842 * dpi / 72)
+
+    doc = fitz.open()
+    truth = {"blank_pages": [], "stamp_pages": [], "documents": []}
+
+    def add_page(jpeg):
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=jpeg)
+        return doc.page_count - 1
+
+    for document_index in range(document_count):
+        gray_scan = gray_every > 0 and document_index % gray_every == gray_every - 1
+        document_number = "".join(str(d) for d in rng.integers(0, 10, size=10))
+        factory_numbers = [random_factory_number(rng, exclude_set) for _ in range(int(rng.integers(1, 4)))]
+        page_count = int(rng.integers(1, 5))
+        pages = []
+        for i in range(page_count):
+            if i == 0:
+                lines = ["臺北市政府 函", f"發文字號：府經工行字第{document_number}號"]
+                lines += [f"工廠登記編號：{number}" for number in factory_numbers]
+                lines += FILLER_LINES[:int(rng.integers(2, len(FILLER_LINES) + 1))]
+            else:
+                lines = list(rng.permutation(FILLER_LINES))
+            img = render_text_page(lines, dpi, rng)
+            img = img.copy() if gray_scan else cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
+            if i == page_count - 1 and templates:
+                template = templates[int(rng.integers(0, len(templates)))]
+                add_stamp(img, cv2.cvtColor(template, cv2.COLOR_RGB2GRAY) if gray_scan else template, rng)
+                truth["stamp_pages"].append(doc.page_count)
+            pages.append(add_page(scan_noise(img, rng)))
+
+            if rng.random() < 0.2:  # 掃描背面的空白頁
+                add_page(blank_scan(width, height, rng, near_blank=rng.random() < 0.5))
+                truth["blank_pages"].append(doc.page_count)
+
+        truth["documents"].append({
+            "pages": pages,
+            "發文字號": f"府經工行字第{document_number}號",
+            "工廠編號": ", ".join(sorted(set(factory_numbers))),
+            "scan": "gray" if gray_scan else "color",
+        })
+
+    truth["page_count"] = doc.page_count
+    doc.save(pdf_path)
+    doc.close()
+    with open(f"{pdf_path}.truth.json", "w", encoding="utf-8") as f:
+        json.dump(truth, f, ensure_ascii=False, indent=2)
+    return truth
+
+
+def precision_recall(found, expected):
+    found, expected = set(found), set(expected)
+    hits = len(found & expected)
+    precision = hits / len(found) if found else 1.0
+    recall = hits / len(expected) if expected else 1.0
+    return round(precision, 4), round(recall, 4)
+
+
+def tesseract_available(config):
+    ensure_tesseract_path(config)
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def check_prefilter(stage, stamp_stages, kept, truth, config, metrics, failures):
+    """
+    預篩應排除彩色掃描中沒有大印的頁面：記錄排除比例（prefilter_reject_rate），
+    一頁都沒排除代表預篩沒有作用，不論基準都列為失敗。
+    """
+    color_pages = {page_num for document in truth["documents"] if document.get("scan", "color") == "color"
+                   for page_num in document["pages"]}
+    stamp_pages = set(truth["stamp_pages"])
+    candidates = len([page_num for page_num in kept if page_num in color_pages and page_num not in stamp_pages])
+    if config.get("stamp_prefilter", "ink") != "ink" or not candidates:
+        return
+    rejected = stamp_stages.get("rejected", 0) + stamp_stages.get("missed", 0)
+    metrics[stage]["prefilter_reject_rate"] = round(rejected / candidates, 4)
+    if not rejected:
+        failures.append(f"{stage}.prefilter_rejected")
+
+
+def extraction_accuracy(rows, documents, truth):
+    """以分割結果（各份文件的頁碼）對應正確答案，計算發文字號、工廠編號的正確率；rows 以 split_<n>.pdf 為鍵"""
+    documents_by_pages = {tuple(document["pages"]): document for document in truth["documents"]}
+    document_hits = factory_hits = 0
+    for i, pages in enumerate(documents):
+        expected = documents_by_pages.get(tuple(pages))
+        row = rows.get(f"split_{i + 1}.pdf")
+        if expected is None or row is None:
+            continue
+        document_hits += row.get("發文字號") == expected["發文字號"]
+        factory_hits += row.get("工廠編號") == expected["工廠編號"]
+    return {"document_number_accuracy": round(document_hits / len(truth["documents"]), 4),
+            "factory_number_accuracy": round(factory_hits / len(truth["documents"]), 4)}
+
+
+def bench_e2e(config, pdf_path=None, document_count=20, skip_ocr=False):
+    """
+    以模擬掃描批次跑完舊流程的各階段與單次渲染流程，回傳各階段吞吐量與正確率。
+
+    舊流程：remove_blank_pages → compare_image_with_pdf_pages_multiprocessing → split_pdf
+          → process_folder_multiprocessing（需 Tesseract，找不到時略過）
+    單次渲染：process_pdf_single_pass（不使用工作目錄；找不到 Tesseract 時不做 OCR，只量測空白、大印與分割）
+    """
+    image_paths = get_images_from_folder(config["image_folder"])
+    work_dir = tempfile.mkdtemp(prefix="bench_e2e_")
+    if pdf_path is None:
+        pdf_path = os.path.join(work_dir, "batch.pdf")
+        exclude_set, _ = load_exclude_set(config.get("exclude_path", "exclude_numbers.txt"))
+        make_scanned_batch(pdf_path, image_paths, document_count, exclude_set=exclude_set)
+    with open(f"{pdf_path}.truth.json", "r", encoding="utf-8") as f:
+        truth = json.load(f)
+
+    run_config = dict(config, cleaned_pdf=os.path.join(work_dir, "remove_blank.pdf"),
+                      process_folder=os.path.join(work_dir, "split_pdf"),
+                      output_excel=os.path.join(work_dir, "factory_extraction.xlsx"), ocr_cache=False)
+    total_pages = truth["page_count"]
+    metrics = {}
+    failures = []  # 不論基準都視為失敗的項目
+
+    start = time.perf_counter()
+    removed_pages = remove_blank_pages(pdf_path, run_config)
+    elapsed = time.perf_counter() - start
+    precision, recall = precision_recall(removed_pages, truth["blank_pages"])
+    metrics["blank"] = {"pages_per_sec": round(total_pages / elapsed, 2), "precision": precision, "recall": recall}
+
+    # 大印比對在清理後的 PDF 上進行，正確答案換算成清理後的頁碼
+    removed = {page_num - 1 for page_num in removed_pages}
+    kept = [page_num for page_num in range(total_pages) if page_num not in removed]
+    expected_stamps = [i for i, page_num in enumerate(kept) if page_num in set(truth["stamp_pages"])]
+    stamp_stats = {}
+    start = time.perf_counter()
+    similar_pages = compare_image_with_pdf_pages_multiprocessing(image_paths, run_config, stamp_stats)
+    elapsed = time.perf_counter() - start
+    precision, recall = precision_recall(similar_pages, expected_stamps)
+    metrics["stamp"] = {"pages_per_sec": round(len(kept) / elapsed, 2), "precision": precision, "recall": recall}
+
+    check_prefilter("stamp", stamp_stats, kept, truth, config, metrics, failures)
+
+    split_points = get_split_points(similar_pages)
+    start = time.perf_counter()
+    split_pdf(run_config["cleaned_pdf"], split_points, run_config["process_folder"])
+    elapsed = time.perf_counter() - start
+    produced = [[kept[i] for i in range(begin, end + 1)] for begin, end in split_ranges(len(kept), split_points)]
+    expected_documents = [document["pages"] for document in truth["documents"]]
+    correct = sum(1 for pages in produced if pages in expected_documents)
+    metrics["split"] = {"pages_per_sec": round(len(kept) / elapsed, 2),
+                        "document_accuracy": round(correct / len(expected_documents), 4)}
+
+    if skip_ocr or not tesseract_available(config):
+        print("\n[略過] 找不到 Tesseract，不量測擷取階段")
+    else:
+        start = time.perf_counter()
+        process_folder_multiprocessing(run_config)
+        elapsed = time.perf_counter() - start
+        rows = {}
+        sheet = load_workbook(run_config["output_excel"], read_only=True).active
+        header = None
+        for row in sheet.iter_rows(values_only=True):
+            if header is None:
+                header = list(row)
+                continue
+            rows[row[header.index("檔名")]] = dict(zip(header, row))
+        metrics["extract"] = {"pages_per_sec": round(len(kept) / elapsed, 2),
+                              **extraction_accuracy(rows, produced, truth)}
+
+    # 單次渲染流程（預設）：同一批次，從原始 PDF 一次完成空白判斷、大印比對、分割與擷取
+    run_ocr = not skip_ocr and tesseract_available(config)
+    single_config = dict(run_config, job_resume=False, process_folder=os.path.join(work_dir, "single_pass"))
+    single_stats = {}
+    start = time.perf_counter()
+    extracted_data = process_pdf_single_pass(pdf_path, image_paths, single_config, save=False,
+                                             stats=single_stats, skip_ocr=not run_ocr)
+    elapsed = time.perf_counter() - start
+    blank_precision, blank_recall = precision_recall(single_stats["removed_pages"], truth["blank_pages"])
+    stamp_precision, stamp_recall = precision_recall(single_stats["stamp_pages"], truth["stamp_pages"])
+    correct = sum(1 for pages in single_stats["documents"] if pages in expected_documents)
+    metrics["single_pass"] = {"pages_per_sec": round(total_pages / elapsed, 2),
+                              "blank_precision": blank_precision, "blank_recall": blank_recall,
+                              "stamp_precision": stamp_precision, "stamp_recall": stamp_recall,
+                              "document_accuracy": round(correct / len(expected_documents), 4)}
+    kept_single = [page_num for page_num in range(total_pages) if page_num + 1 not in single_stats["removed_pages"]]
+    check_prefilter("single_pass", single_stats["stamp_stages"], kept_single, truth, config, metrics, failures)
+    if run_ocr:
+        rows = {data["檔名"]: data for data in extracted_data}
+        metrics["single_pass"].update(extraction_accuracy(rows, single_stats["documents"], truth))
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"\n模擬批次：{total_pages} 頁，{len(truth['documents'])} 份文件，空白頁 {len(truth['blank_pages'])} 頁")
+    print(f"{'階段':<12}{'指標':<28}{'數值':>10}")
+    for stage, values in metrics.items():
+        for name, value in values.items():
+            print(f"{stage:<12}{name:<28}{value:>10}")
+    return {"pdf": pdf_path, "pages": total_pages, "documents": len(truth["documents"]), "metrics": metrics,
+            "failures": failures}
+
+
+def bench_adaptive_ocr(config, pdf_path=None, document_count=10):
+    """以模擬掃描批次（單一行程）比較固定 dpi 與自適應 OCR 的耗時與擷取正確率"""
+    if not tesseract_available(config):
+        print("[略過] 找不到 Tesseract")
+        return []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if pdf_path is None:
+            pdf_path = os.path.join(tmp_dir, "batch.pdf")
+            exclude_set, _ = load_exclude_set(config.get("exclude_path", "exclude_numbers.txt"))
+            make_scanned_batch(pdf_path, get_images_from_folder(config["image_folder"]), document_count,
+                               exclude_set=exclude_set)
+        with open(f"{pdf_path}.truth.json", "r", encoding="utf-8") as f:
+            truth = json.load(f)
+
+        rows = []
+        with fitz.open(pdf_path) as doc:
+            for name, adaptive in (("固定 dpi", False), ("自適應", True)):
+                mode_config = dict(config, adaptive_ocr=adaptive, ocr_cache=False)
+                stats = {"ocr": 0, "escalated": 0}
+                document_hits = factory_hits = 0
+                start = time.perf_counter()
+                for document in truth["documents"]:
+                    text = join_page_texts([page_to_text(doc[page_num], mode_config, stats)
+                                            for page_num in document["pages"]])
+                    data = extract_text_data(text, mode_config)
+                    document_hits += data["發文字號"] == document["發文字號"]
+                    factory_hits += data["工廠編號"] == document["工廠編號"]
+                elapsed = time.perf_counter() - start
+                rows.append({
+                    "mode": name,
+                    "seconds": elapsed,
+                    "ocr_pages": stats["ocr"],
+                    "escalated_pages": stats["escalated"],
+                    "document_number_accuracy": document_hits / len(truth["documents"]),
+                    "factory_number_accuracy": factory_hits / len(truth["documents"]),
+                })
+
+    print(f"{len(truth['documents'])} 份文件，低解析度 {config.get('ocr_low_dpi', 150)} dpi，"
+          f"完整解析度 {config.get('dpi', 300)} dpi")
+    print(f"{'模式':<10}{'秒數':>10}{'OCR 頁數':>10}{'提高解析度':>12}{'發文字號':>10}{'工廠編號':>10}")
+    for row in rows:
+        print(f"{row['mode']:<10}{row['seconds']:>10.2f}{row['ocr_pages']:>10}{row['escalated_pages']:>12}"
+              f"{row['document_number_accuracy']:>10.1%}{row['factory_number_accuracy']:>10.1%}")
+    return rows
+
+
+def bench_preprocess(config, pdf_path=None, document_count=10, max_skew=3.0, seed=0):
+    """
+    在模擬掃描批次的每頁再加上 ±max_skew 度的歪斜，量測前處理每頁耗時與轉正後的殘餘角度；
+    找得到 Tesseract 時另外比較有無前處理的 OCR 耗時（含前處理）與擷取正確率。
+    """
+    rng = np.random.default_rng(seed)
+    run_ocr = tesseract_available(config)
+    preprocess_config = dict(config, preprocess=True)
+    dpi = config.get("dpi", 300)
+
+    preprocess_seconds, residuals = [], []
+    modes = {name: {"seconds": 0.0, "document_hits": 0, "factory_hits": 0} for name in ("原始", "前處理")}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if pdf_path is None:
+            pdf_path = os.path.join(tmp_dir, "batch.pdf")
+            exclude_set, _ = load_exclude_set(config.get("exclude_path", "exclude_numbers.txt"))
+            make_scanned_batch(pdf_path, get_images_from_folder(config["image_folder"]), document_count,
+                               exclude_set=exclude_set)
+        with open(f"{pdf_path}.truth.json", "r", encoding="utf-8") as f:
+            truth = json.load(f)
+
+        with fitz.open(pdf_path) as doc:
+            for document in truth["documents"]:
+                texts = {name: [] for name in modes}
+                for page_num in document["pages"]:
+                    image = rotate_image(render_page_array(doc[page_num], dpi=dpi), rng.uniform(-max_skew, max_skew))
+
+                    start = time.perf_counter()
+                    clean, ocr_input = preprocess_image(image, preprocess_config)
+                    elapsed = time.perf_counter() - start
+                    preprocess_seconds.append(elapsed)
+                    residuals.append(abs(estimate_skew(to_gray(clean))))
+                    if not run_ocr:
+                        continue
+
+                    for name, ocr_input_image, extra in (("原始", image, 0.0), ("前處理", ocr_input, elapsed)):
+                        start = time.perf_counter()
+                        texts[name].append(ocr_image(ocr_input_image, config))
+                        modes[name]["seconds"] += time.perf_counter() - start + extra
+
+                if run_ocr:
+                    for name, page_texts in texts.items():
+                        data = extract_text_data(join_page_texts(page_texts), config)
+                        modes[name]["document_hits"] += data["發文字號"] == document["發文字號"]
+                        modes[name]["factory_hits"] += data["工廠編號"] == document["工廠編號"]
+
+    result = {
+        "pages": len(preprocess_seconds),
+        "preprocess_ms_per_page": round(float(np.mean(preprocess_seconds)) * 1000, 1),
+        "residual_skew_mean": round(float(np.mean(residuals)), 3),
+        "residual_skew_max": round(float(np.max(residuals)), 3),
+    }
+    print(f"{result['pages']} 頁（{dpi} dpi，另加 ±{max_skew} 度歪斜）")
+    print(f"前處理每頁 {result['preprocess_ms_per_page']} 毫秒，轉正後殘餘角度平均 {result['residual_skew_mean']} 度、"
+          f"最大 {result['residual_skew_max']} 度")
+    if not run_ocr:
+        print("[略過] 找不到 Tesseract，不比較 OCR 耗時與正確率")
+        return result
+
+    documents = len(truth["documents"])
+    print(f"{'模式':<8}{'OCR 秒數':>10}{'發文字號':>10}{'工廠編號':>10}")
+    for name, row in modes.items():
+        row["document_number_accuracy"] = row.pop("document_hits") / documents
+        row["factory_number_accuracy"] = row.pop("factory_hits") / documents
+        print(f"{name:<8}{row['seconds']:>10.2f}{row['document_number_accuracy']:>10.1%}"
+              f"{row['factory_number_accuracy']:>10.1%}")
+    result["ocr"] = modes
+    return result
+
+
+def check_baseline(result, baseline_path, tolerance=0.2, save=False):
+    """
+    與儲存的基準比較：正確率下降超過 0.01，或吞吐量（*_per_sec）下降超過 tolerance 視為退步。
+
+    Returns:
+        List[str]: 退步項目，沒有時為空
+    """
+    if save or not os.path.exists(baseline_path):
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(result["metrics"], f, ensure_ascii=False, indent=2)
+        print(f"\n已儲存基準：{baseline_path}")
+        return []
+
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = []
+    print(f"\n與基準比較（{baseline_path}）：")
+    for stage, values in result["metrics"].items():
+        for name, value in values.items():
+            expected = baseline.get(stage, {}).get(name)
+            if expected is None:
+                continue
+            if name.endswith("_per_sec"):
+                failed = value < expected * (1 - tolerance)
+            else:
+                failed = value < expected - 0.01
+            mark = "退步" if failed else "OK"
+            print(f"  {stage}.{name}: {expected} → {value}  {mark}")
+            if failed:
+                regressions.append(f"{stage}.{name}")
+    return regressions
+
+
+def legacy_render_pages(pdf_path, dpi, poppler_path):
+    """舊版作法：每一頁都以 convert_from_path 重新渲染整份文件"""
+    from pdf2image import convert_from_path
+
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    for i in range(page_count):
+        images = convert_from_path(pdf_path, dpi=dpi, poppler_path=poppler_path)
+        images[i].load()
+
+
+def render_pages(pdf_path, dpi):
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            render_page_array(page, dpi=dpi)
+
+
+def bench_ocr_scaling(config, page_counts, render_only=False, legacy=False):
+    dpi = config.get("dpi", 300)
+    if not render_only:
+        ensure_tesseract_path(config)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for page_count in page_counts:
+            pdf_path = os.path.join(tmp_dir, f"bench_{page_count}.pdf")
+            make_raster_pdf(pdf_path, page_count)
+
+            start = time.perf_counter()
+            if legacy:
+                legacy_render_pages(pdf_path, dpi, config.get("poppler_path"))
+            elif render_only:
+                render_pages(pdf_path, dpi)
+            else:
+                pdf_to_text(pdf_path, config)
+            elapsed = time.perf_counter() - start
+            rows.append({"pages": page_count, "seconds": elapsed, "sec_per_page": elapsed / page_count})
+
+    print(f"{'頁數':<8}{'總秒數':>10}{'每頁秒數':>12}")
+    for row in rows:
+        print(f"{row['pages']:<8}{row['seconds']:>10.3f}{row['sec_per_page']:>12.4f}")
+
+    # 每頁耗時固定代表線性；舊版會隨頁數成長
+    growth = rows[-1]["sec_per_page"] / rows[0]["sec_per_page"] if rows[0]["sec_per_page"] else 0
+    print(f"每頁耗時變化（最多頁 / 最少頁）：{growth:.2f}x")
+    return rows
+
+
+def detect_stamps(page_images, template_features, config):
+    start = time.perf_counter()
+    pixels = 0
+    similar_pages = []
+    for page_num, page_img in enumerate(page_images):
+        view = prepare_stamp_view(page_img, config)
+        pixels += view.size
+        if compare_page_with_templates(view, template_features, get_match_threshold(config),
+                                       config.get("matcher", "bf")):
+            similar_pages.append(page_num)
+    return similar_pages, time.perf_counter() - start, pixels
+
+
+def bench_stamp_roi(config, pdf_path=None, page_count=40, region=(0.0, 0.5, 1.0, 1.0)):
+    """比較整頁模式與搜尋區域 region（頁面比例框，預設下半頁）的速度與偵測結果"""
+    image_paths = get_images_from_folder(config["image_folder"])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if pdf_path is None:
+            pdf_path = os.path.join(tmp_dir, "stamped.pdf")
+            make_stamped_pdf(pdf_path, page_count, image_paths[0])
+        with fitz.open(pdf_path) as doc:
+            page_images = [render_page_array(page, dpi=72, gray=True) for page in doc]
+
+    full_config = dict(config, stamp_search_region=[0.0, 0.0, 1.0, 1.0],
+                       stamp_downscale=1.0, stamp_template_scales=[1.0])
+    full_pages, full_seconds, full_pixels = detect_stamps(
+        page_images, load_template_features(image_paths, full_config), full_config)
+    roi_config = dict(config, stamp_search_region=list(region))
+    roi_pages, roi_seconds, roi_pixels = detect_stamps(
+        page_images, load_template_features(image_paths, roi_config), roi_config)
+
+    print(f"{'模式':<10}{'秒數':>10}{'像素比例':>10}{'偵測頁數':>10}")
+    print(f"{'整頁':<10}{full_seconds:>10.3f}{1:>10.2f}{len(full_pages):>10}")
+    print(f"{'搜尋區域':<10}{roi_seconds:>10.3f}{roi_pixels / full_pixels:>10.2f}{len(roi_pages):>10}")
+    print(f"加速：{full_seconds / roi_seconds:.2f}x")
+
+    mismatched = sorted(set(full_pages) ^ set(roi_pages))
+    if mismatched:
+        print(f"[警告] 偵測結果不一致的頁面：{[p + 1 for p in mismatched]}")
+    else:
+        print("偵測結果與整頁模式一致")
+
+    return {
+        "full_seconds": full_seconds,
+        "roi_seconds": roi_seconds,
+        "pixel_ratio": roi_pixels / full_pixels,
+        "mismatched_pages": [p + 1 for p in mismatched],
+    }
+
+
+def bench_matchers(config, pdf_path=None, labels=None, page_count=40):
+    """
+    以標記好大印頁碼的樣本比較各比對方式。
+
+    labels 為有大印的頁碼（從 1 開始）；未指定 pdf_path 時產生每 5 頁一個大印的測試檔。
+    建議門檻為「沒有大印的頁面中最高的配對數」，配對數需大於此值才判定相似。
+    """
+    image_paths = get_images_from_folder(config["image_folder"])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if pdf_path is None:
+            pdf_path = os.path.join(tmp_dir, "stamped.pdf")
+            make_stamped_pdf(pdf_path, page_count, image_paths[0], stamp_every=5)
+            labels = [i + 1 for i in range(page_count) if (i + 1) % 5 == 0]
+        with fitz.open(pdf_path) as doc:
+            views = [prepare_stamp_view(render_page_array(page, dpi=72), config) for page in doc]
+
+    positives = {page - 1 for page in labels or []}
+    rows = []
+    for matcher in MATCHER_DETECTORS:
+        matcher_config = dict(config, matcher=matcher)
+        try:
+            template_features = load_template_features(image_paths, matcher_config)
+        except ValueError as e:
+            print(f"[略過] {matcher}：{e}")
+            continue
+
+        start = time.perf_counter()
+        counts = [best_match_count(view, template_features, matcher) for view in views]
+        elapsed = time.perf_counter() - start
+
+        threshold = get_match_threshold(matcher_config)
+        predicted = {i for i, count in enumerate(counts) if count > threshold}
+        negative_counts = [count for i, count in enumerate(counts) if i not in positives]
+        positive_counts = [count for i, count in enumerate(counts) if i in positives]
+        max_negative = max(negative_counts, default=0)
+        min_positive = min(positive_counts, default=0)
+
+        rows.append({
+            "matcher": matcher,
+            "seconds": elapsed,
+            "ms_per_page": elapsed / len(views) * 1000,
+            "threshold": threshold,
+            "true_positive": len(predicted & positives),
+            "false_positive": len(predicted - positives),
+            "false_negative": len(positives - predicted),
+            "max_negative": max_negative,
+            "min_positive": min_positive,
+            "suggested_threshold": max_negative if min_positive > max_negative else None,
+        })
+
+    print(f"{'比對方式':<8}{'每頁毫秒':>10}{'門檻':>6}{'TP':>5}{'FP':>5}{'FN':>5}"
+          f"{'無印最高':>10}{'有印最低':>10}{'建議門檻':>10}")
+    for row in rows:
+        suggested = row["suggested_threshold"] if row["suggested_threshold"] is not None else "無法區分"
+        print(f"{row['matcher']:<8}{row['ms_per_page']:>10.1f}{row['threshold']:>6}{row['true_positive']:>5}"
+              f"{row['false_positive']:>5}{row['false_negative']:>5}{row['max_negative']:>10}"
+              f"{row['min_positive']:>10}{suggested:>10}")
+
+    usable = [row for row in rows if row["false_negative"] == 0 and row["false_positive"] == 0]
+    if usable:
+        fastest = min(usable, key=lambda row: row["seconds"])
+        print(f"建議使用：{fastest['matcher']}（找到所有分割點中最快）")
+    else:
+        print("[警告] 目前門檻下沒有比對方式能找出所有分割點，請參考建議門檻調整 matcher_thresholds")
+    return rows
+
+
+def bench_ocr_backends(config, pdf_path=None, page_count=10):
+    """以同一批頁面影像比較兩種 OCR 後端的每頁延遲（第一頁含引擎初始化另計）"""
+    ensure_tesseract_path(config)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if pdf_path is None:
+            pdf_path = os.path.join(tmp_dir, "numbers.pdf")
+            make_number_pdf(pdf_path, page_count)
+        with fitz.open(pdf_path) as doc:
+            images = [render_page_array(page, dpi=config.get("dpi", 300), gray=True) for page in doc]
+
+    rows = []
+    for backend in ("pytesseract", "tesserocr"):
+        backend_config = dict(config, ocr_backend=backend)
+        latencies = []
+        for image in images:
+            start = time.perf_counter()
+            ocr_image(image, backend_config)
+            latencies.append(time.perf_counter() - start)
+
+        steady = latencies[1:] or latencies
+        rows.append({
+            "backend": backend,
+            "first_ms": latencies[0] * 1000,
+            "median_ms": float(np.median(steady)) * 1000,
+            "p95_ms": float(np.percentile(steady, 95)) * 1000,
+        })
+
+    print(f"{'後端':<12}{'第一頁毫秒':>12}{'中位數毫秒':>12}{'P95毫秒':>10}")
+    for row in rows:
+        print(f"{row['backend']:<12}{row['first_ms']:>12.1f}{row['median_ms']:>12.1f}{row['p95_ms']:>10.1f}")
+    print("（tesserocr 無法載入時會自動改用 pytesseract，兩列結果將相近）")
+    return rows
+
+
+def legacy_extract_text_data(text, config):
+    """舊版作法：每份文件重新讀取排除清單，正規表示式以字串傳入"""
+    exclude_path = config.get("exclude_path", "exclude_numbers.txt")
+    try:
+        with open(exclude_path, "r", encoding="utf-8") as f:
+            exclude_set = set(line.strip() for line in f if re.fullmatch(r"\d{8}", line.strip()))
+    except FileNotFoundError:
+        exclude_set = set()
+
+    document_number_match = re.search(config["document_number_pattern"], text)
+    document_number = f"府經工行字第{document_number_match.group(1)}號" if document_number_match else "未匹配"
+    matches = re.findall(config["factory_number_pattern"], text)
+    factory_numbers = [m1 if m1 else m2 for m1, m2 in matches]
+    filtered = [num for num in factory_numbers if not (re.fullmatch(r"\d{8}", num) and num in exclude_set)]
+    unique_factory_numbers = sorted(set(filtered))
+    return {
+        "發文字號": document_number,
+        "工廠編號": ", ".join(unique_factory_numbers) if unique_factory_numbers else "無",
+    }
+
+
+def make_ocr_text(rng, pages=5, lines_per_page=40):
+    """產生類似 OCR 結果的文字：中文、雜訊數字、工廠編號與發文字號"""
+    words = ["主旨", "說明", "工廠登記", "變更", "核准", "地址", "電話", "桃園市", "公司", "依據"]
+    page_texts = []
+    for _ in range(pages):
+        lines = []
+        for _ in range(lines_per_page):
+            line = " ".join(rng.choice(words, size=4))
+            kind = rng.integers(0, 6)
+            if kind == 0:
+                line += f" {rng.integers(10**7, 10**8)}"
+            elif kind == 1:
+                line += f" S{rng.integers(10**6, 10**7)}"
+            elif kind == 2:
+                line += f" 府經工行字第{rng.integers(10**9, 10**10)}號"
+            elif kind == 3:
+                line += f" 03-{rng.integers(10**6, 10**7)}"
+            lines.append(line)
+        page_texts.append("\n".join(lines))
+    return "".join(f"--- 第 {i + 1} 頁 ---\n{text}\n" for i, text in enumerate(page_texts))
+
+
+def bench_extract(config, document_count=200, exclude_count=300000):
+    rng = np.random.default_rng(0)
+    texts = [make_ocr_text(rng) for _ in range(document_count)]
+    total_mb = sum(len(text.encode("utf-8")) for text in texts) / 1024 / 1024
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        exclude_path = os.path.join(tmp_dir, "exclude_numbers.txt")
+        with open(exclude_path, "w", encoding="utf-8") as f:
+            for number in rng.integers(10**7, 10**8, size=exclude_count):
+                f.write(f"{number}\n")
+        bench_config = dict(config, exclude_path=exclude_path)
+
+        rows = []
+        for name, extract in (("舊版", legacy_extract_text_data), ("預先編譯", extract_text_data)):
+            start = time.perf_counter()
+            results = [extract(text, bench_config) for text in texts]
+            elapsed = time.perf_counter() - start
+            rows.append({"name": name, "seconds": elapsed, "results": results})
+
+    if rows[0]["results"] != rows[1]["results"]:
+        print("[警告] 兩種作法的擷取結果不一致")
+
+    print(f"{document_count} 份文件，{total_mb:.1f} MB 文字，排除清單 {exclude_count} 筆")
+    print(f"{'作法':<10}{'秒數':>10}{'份/秒':>10}{'MB/秒':>10}")
+    for row in rows:
+        print(f"{row['name']:<10}{row['seconds']:>10.3f}{document_count / row['seconds']:>10.1f}"
+              f"{total_mb / row['seconds']:>10.2f}")
+    return [{"name": row["name"], "seconds": row["seconds"]} for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="工廠登記公文處理效能量測")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--json", help="將結果另存為 JSON")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    ocr = sub.add_parser("ocr-scaling", help="pdf_to_text 頁數擴充性")
+    ocr.add_argument("--pages", type=int, nargs="+", default=[1, 5, 20, 50])
+    ocr.add_argument("--render-only", action="store_true", help="只量測渲染，不執行 OCR")
+    ocr.add_argument("--legacy", action="store_true", help="量測舊版 convert_from_path 作法（需 Poppler）")
+
+    stamp = sub.add_parser("stamp-roi", help="大印偵測搜尋區域與縮小模式")
+    stamp.add_argument("--pdf", help="樣本 PDF，未指定則產生測試檔")
+    stamp.add_argument("--pages", type=int, default=40)
+    stamp.add_argument("--region", default="0,0.5,1,1", help="搜尋區域 左,上,右,下（頁面比例，預設下半頁）")
+
+    matchers = sub.add_parser("matchers", help="比較各比對方式的速度與正確率")
+    matchers.add_argument("--pdf", help="樣本 PDF，未指定則產生測試檔")
+    matchers.add_argument("--labels", help="有大印的頁碼（從 1 開始，以逗號分隔）")
+    matchers.add_argument("--pages", type=int, default=40)
+
+    backends = sub.add_parser("ocr-backends", help="比較 OCR 後端每頁延遲")
+    backends.add_argument("--pdf", help="樣本 PDF，未指定則產生測試檔")
+    backends.add_argument("--pages", type=int, default=10)
+
+    extract = sub.add_parser("extract", help="擷取規則吞吐量")
+    extract.add_argument("--documents", type=int, default=200)
+    extract.add_argument("--exclude", type=int, default=300000, help="排除清單筆數")
+
+    generate = sub.add_parser("generate", help="產生模擬掃描批次 PDF")
+    generate.add_argument("--out", default="synthetic_batch.pdf")
+    generate.add_argument("--documents", type=int, default=20)
+    generate.add_argument("--seed", type=int, default=0)
+
+    e2e = sub.add_parser("e2e", help="端到端量測各階段吞吐量與正確率")
+    e2e.add_argument("--pdf", help="由 generate 產生的樣本（需有 .truth.json），未指定則產生測試檔")
+    e2e.add_argument("--documents", type=int, default=20)
+    e2e.add_argument("--skip-ocr", action="store_true", help="不量測擷取階段")
+    e2e.add_argument("--baseline", default="benchmark_baseline.json", help="基準檔，不存在時以本次結果建立")
+    e2e.add_argument("--save-baseline", action="store_true", help="以本次結果覆寫基準")
+    e2e.add_argument("--tolerance", type=float, default=0.2, help="吞吐量允許下降的比例")
+
+    adaptive = sub.add_parser("ocr-adaptive", help="比較固定 dpi 與自適應 OCR")
+    adaptive.add_argument("--pdf", help="由 generate 產生的樣本（需有 .truth.json），未指定則產生測試檔")
+    adaptive.add_argument("--documents", type=int, default=10)
+
+    preprocess = sub.add_parser("preprocess", help="前處理耗時與對 OCR 的影響")
+    preprocess.add_argument("--pdf", help="由 generate 產生的樣本（需有 .truth.json），未指定則產生測試檔")
+    preprocess.add_argument("--documents", type=int, default=10)
+    preprocess.add_argument("--max-skew", type=float, default=3.0, help="額外加入的最大歪斜角度")
+
+    args = parser.parse_args()
+    config = load_config(args.config)
+
+    if args.bench == "ocr-scaling":
+        result = bench_ocr_scaling(config, args.pages, args.render_only, args.legacy)
+    elif args.bench == "stamp-roi":
+        region = [float(value) for value in args.region.split(",")]
+        result = bench_stamp_roi(config, args.pdf, args.pages, region)
+    elif args.bench == "matchers":
+        labels = [int(page) for page in args.labels.split(",")] if args.labels else None
+        result = bench_matchers(config, args.pdf, labels, args.pages)
+    elif args.bench == "ocr-backends":
+        result = bench_ocr_backends(config, args.pdf, args.pages)
+    elif args.bench == "extract":
+        result = bench_extract(config, args.documents, args.exclude)
+    elif args.bench == "generate":
+        exclude_set, _ = load_exclude_set(config.get("exclude_path", "exclude_numbers.txt"))
+        result = make_scanned_batch(args.out, get_images_from_folder(config["image_folder"]), args.documents,
+                                    args.seed, exclude_set=exclude_set)
+        print(f"已產生 {args.out}：{result['page_count']} 頁，{len(result['documents'])} 份文件")
+    elif args.bench == "e2e":
+        result = bench_e2e(config, args.pdf, args.documents, args.skip_ocr)
+    elif args.bench == "ocr-adaptive":
+        result = bench_adaptive_ocr(config, args.pdf, args.documents)
+    elif args.bench == "preprocess":
+        result = bench_preprocess(config, args.pdf, args.documents, args.max_skew)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.bench == "e2e":
+        regressions = result["failures"] + check_baseline(result, args.baseline, args.tolerance, args.save_baseline)
+        if regressions:
+            print("效能或正確率退步：" + "、".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,20 @@ from selenium.webdriver.support import expected_conditions as EC #等待載入
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 import time     #輔助
+import argparse
+import hashlib
 import json
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from urllib.parse import urljoin
 from openpyxl import load_workbook
 from openpyxl.utils import get_column_letter
 from openpyxl.utils.exceptions import InvalidFileException
+from tracing import span, start_trace, export_trace
 
 
 def safe_load_workbook(file_path, retries=10, wait_seconds=1):
@@ -28,7 +38,8 @@ def safe_save_workbook(workbook, file_path, retries=10, wait_seconds=3):
     """安全儲存 Excel，如果檔案被鎖住則重試。"""
     for attempt in range(retries):
         try:
-            workbook.save(file_path)
+            with span("workbook_save", path=file_path):
+                workbook.save(file_path)
             return
         except PermissionError:
             print(f"無法儲存 Excel，檔案可能正被開啟中（第 {attempt+1} 次重試）...")
@@ -55,9 +66,8 @@ def setup_chrome_driver():
 
 #警告處理
 def handle_alert(driver):
-    """處理網頁彈出的警告視窗。"""
+    """處理網頁彈出的警告視窗（查詢頁的格式檢查在送出時同步跳出，不需等待）。"""
     try:
-        time.sleep(0.2)
         alert = driver.switch_to.alert
         print(alert.text)
         alert.accept()
@@ -66,12 +76,30 @@ def handle_alert(driver):
         pass
     return 0
 
-def process_excel_data(file_path, search_col=1):
-    """從 Excel 讀取資料，進行網頁查詢，並將結果寫回 Excel。"""
-    driver = setup_chrome_driver()
-    driver.get("https://serv.gcis.nat.gov.tw/Fidbweb/index.jsp")
-    wait = WebDriverWait(driver, 10)
 
+REGISTRY_URL = "https://serv.gcis.nat.gov.tw/Fidbweb/index.jsp"
+
+# 查詢頁送出前的格式檢查：8 碼數字或 S 加 7 碼數字；不符時兩種查詢方式都不送出，回傳相同結果
+REGI_ID_PATTERN = re.compile(r'^(?:\d{8}|S\d{7})$')
+INVALID_ID_RESULT = ['資料無法查詢']
+
+# 結果頁與工廠資料頁的欄位位置（瀏覽器與 HTTP 查詢共用）
+RESULT_TITLE_XPATH = '/html/body/form/table/tbody/tr/td/table[2]/tbody/tr[1]/th[2]/font/h2'
+RESULT_LINK_XPATH = '/html/body/form/table/tbody/tr/td/table[2]/tbody/tr[2]/td[2]/h3/a'
+DETAIL_TITLE_XPATH = '/html/body/form/div/div[2]/div/div[3]/h2/b/font'
+# 依寫入 Excel 的順序：工廠位置、工廠名稱、工廠地址、工廠編號、營業狀況
+RESULT_FIELD_XPATHS = [
+    '//*[@id="AutoNumber4"]/tbody/tr[3]/td[1]/font',
+    '//*[@id="factInfoMain"]/b/font',
+    '//*[@id="AutoNumber4"]/tbody/tr[2]/td/font',
+    '//*[@id="AutoNumber4"]/tbody/tr[1]/td[1]/font',
+    '//*[@id="AutoNumber4"]/tbody/tr[7]/td/font',
+]
+
+
+def open_search_frame(driver, wait, url=REGISTRY_URL):
+    """開啟查詢網頁並切換到 search 框架"""
+    driver.get(url)
     search_frame = driver.find_element(By.NAME, 'search')
     driver.switch_to.frame(search_frame)
 
@@ -80,6 +108,387 @@ def process_excel_data(file_path, search_col=1):
     except Exception:
         raise TimeoutError('連線逾時，請關閉後重新操作')
 
+
+def query_factory(driver, wait, search_value):
+    """在 search 框架送出一筆工廠編號，回傳查詢結果欄位"""
+    search_input = driver.find_element(By.NAME, 'regiID')
+    search_input.clear()
+    search_input.send_keys(search_value)
+    search_input.send_keys(Keys.RETURN)
+
+    if handle_alert(driver):
+        return list(INVALID_ID_RESULT)
+
+    driver.switch_to.parent_frame()
+    result_frame = driver.find_element(By.NAME, 'show')
+    driver.switch_to.frame(result_frame)
+    return perform_web_search(driver, wait)
+
+
+def quit_driver(driver):
+    try:
+        driver.quit()  # 關閉瀏覽器
+    except Exception:
+        pass
+
+
+class DriverPool:
+    """每個查詢執行緒各自持有一個瀏覽器，第一次使用時才啟動"""
+
+    def __init__(self, url=REGISTRY_URL):
+        self.url = url
+        self.local = threading.local()
+        self.sessions = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        """取得目前執行緒的瀏覽器；啟動或開啟查詢頁失敗時關閉瀏覽器並拋出例外，由該筆查詢重試"""
+        session = getattr(self.local, "session", None)
+        if session is None:
+            driver = setup_chrome_driver()
+            session = (driver, WebDriverWait(driver, 10))
+            try:
+                open_search_frame(*session, self.url)
+            except Exception:
+                quit_driver(driver)  # 不留下沒有人管理的瀏覽器
+                raise
+            self.local.session = session
+            with self.lock:
+                self.sessions.append(session)
+        return session
+
+    def lookup(self, search_value):
+        if not REGI_ID_PATTERN.match(search_value):
+            return list(INVALID_ID_RESULT)
+        driver, wait = self.get()
+        return query_factory(driver, wait, search_value)
+
+    def reset(self):
+        """查詢出錯時重新載入查詢頁，讓下一次重試從乾淨的狀態開始；重新載入失敗時關閉瀏覽器，下次查詢重新啟動"""
+        session = getattr(self.local, "session", None)
+        if session is None:
+            return  # 瀏覽器尚未啟動成功，下次查詢時再啟動
+        try:
+            open_search_frame(*session, self.url)
+        except Exception:
+            self.local.session = None
+            with self.lock:
+                self.sessions.remove(session)
+            quit_driver(session[0])
+
+    def close(self):
+        for driver, _ in self.sessions:
+            quit_driver(driver)
+
+
+class RateLimiter:
+    """限制每秒送出的請求數（所有執行緒共用）；rate <= 0 表示不限制"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def xpath_first(tree, xpath):
+    """取第一個符合的節點；lxml 不會自動補 tbody，找不到時改用去掉 tbody 的路徑"""
+    nodes = tree.xpath(xpath)
+    if not nodes and '/tbody' in xpath:
+        nodes = tree.xpath(xpath.replace('/tbody', ''))
+    return nodes[0] if nodes else None
+
+
+class RegistryHttpClient:
+    """不開瀏覽器，直接以 HTTP 送出查詢表單並解析結果頁。
+
+    表單的網址、方法與隱藏欄位從查詢頁（search 框架）讀取；每個執行緒一個
+    requests.Session，保留 Cookie 並重複使用連線。
+    """
+
+    def __init__(self, url=REGISTRY_URL, rate_limit=0, timeout=10, pool_size=10):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from lxml import html
+
+        self.requests = requests
+        self.adapter = partial(HTTPAdapter, pool_connections=1, pool_maxsize=pool_size)
+        self.html = html
+        self.url = url
+        self.timeout = timeout
+        self.rate = RateLimiter(rate_limit)
+        self.local = threading.local()
+        self.sessions = []
+        self.lock = threading.Lock()
+        self.form_lock = threading.Lock()
+        self.form = None
+        self.form_error = None
+
+    def session(self):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.requests.Session()
+            session.mount('http://', self.adapter())
+            session.mount('https://', self.adapter())
+            self.local.session = session
+            with self.lock:
+                self.sessions.append(session)
+        return session
+
+    def fetch(self, url, method='GET', data=None):
+        """送出請求並回傳 (最終網址, 解析後的 HTML)"""
+        self.rate.wait()
+        if method == 'POST':
+            response = self.session().post(url, data=data, timeout=self.timeout)
+        else:
+            response = self.session().get(url, params=data, timeout=self.timeout)
+        response.raise_for_status()
+        return response.url, self.html.fromstring(response.content)
+
+    def discover_form(self):
+        """從 index.jsp 找到 search 框架，再讀出含 regiID 的查詢表單"""
+        with self.form_lock:
+            if self.form is not None:
+                return self.form
+            if self.form_error is not None:
+                raise self.form_error
+            try:
+                page_url, tree = self.fetch(self.url)
+                frame = xpath_first(tree, '//frame[@name="search"] | //iframe[@name="search"]')
+                if frame is not None:
+                    page_url, tree = self.fetch(urljoin(page_url, frame.get('src')))
+
+                form = xpath_first(tree, '//form[.//input[@name="regiID"]]')
+                if form is None:
+                    raise ValueError('查詢頁找不到 regiID 表單')
+                fields = {
+                    field.get('name'): field.get('value', '')
+                    for field in form.xpath('.//input[@type="hidden"][@name]')
+                }
+                self.form = (urljoin(page_url, form.get('action') or page_url),
+                             (form.get('method') or 'GET').upper(), fields)
+            except Exception as e:
+                # 查詢頁結構不符時不再重複嘗試，整批改用瀏覽器
+                self.form_error = e
+                raise
+            return self.form
+
+    def lookup(self, search_value):
+        if not REGI_ID_PATTERN.match(search_value):
+            return list(INVALID_ID_RESULT)  # 與瀏覽器送出時跳出的格式錯誤警告相同
+        action, method, fields = self.discover_form()
+        list_url, tree = self.fetch(action, method, dict(fields, regiID=search_value))
+
+        result_link = xpath_first(tree, RESULT_LINK_XPATH)
+        if result_link is None:
+            # 只有確實是結果清單（有標題列）才算查無資料；系統忙碌、逾時等頁面拋出例外，交給重試與瀏覽器
+            if xpath_first(tree, RESULT_TITLE_XPATH) is None:
+                raise ValueError('回應不是查詢結果頁（可能是系統忙碌或連線逾時）')
+            return ['查無資料']
+
+        _, detail = self.fetch(urljoin(list_url, result_link.get('href')))
+        results = []
+        for xpath in RESULT_FIELD_XPATHS:
+            node = xpath_first(detail, xpath)
+            if node is None:
+                raise ValueError(f'工廠資料頁缺少欄位：{xpath}')
+            results.append(node.text_content().strip())
+        return results
+
+    def reset(self):
+        pass
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
+
+
+def make_lookup_backend(config):
+    """依 query_backend 建立查詢後端；http 無法使用時回傳 None，改用瀏覽器"""
+    url = config.get("registry_url", REGISTRY_URL)
+    if config.get("query_backend", "selenium") != "http":
+        return None
+    try:
+        return RegistryHttpClient(url, config.get("query_rate_limit", 0), pool_size=config.get("query_http_concurrency", 8))
+    except ImportError as e:
+        print(f"[警告] 無法使用 HTTP 查詢（{e}），改用瀏覽器。")
+        return None
+
+
+def lookup_with_retry(backend, search_value, retries=2):
+    """單筆查詢，失敗時重試；全部失敗則回傳 None 而不中斷整批"""
+    for attempt in range(retries + 1):
+        try:
+            with span("lookup", regi_id=search_value, backend=type(backend).__name__, attempt=attempt + 1):
+                return backend.lookup(search_value)
+        except Exception as e:
+            print(f'查詢 {search_value} 失敗（第 {attempt + 1} 次）：{e}')
+            try:
+                backend.reset()
+            except Exception as e:
+                print(f'重設查詢連線失敗：{e}')
+    return None
+
+
+def run_lookups(backend, values, workers, retries):
+    """以 workers 個執行緒同時查詢，依完成順序產生 (編號, 結果)"""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {}
+        for order, value in enumerate(values, start=1):
+            print(f'Submiting {order} : {value}')
+            futures[executor.submit(lookup_with_retry, backend, value, retries)] = value
+
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+# 可以快取的查詢結果（查詢失敗、格式錯誤不快取）
+CACHEABLE_RESULT_LENGTH = 5
+
+
+def open_lookup_cache(config):
+    """開啟工廠查詢快取，未啟用時回傳 None"""
+    if not config.get("lookup_cache", False):
+        return None
+    conn = sqlite3.connect(config.get("lookup_cache_path", "lookup_cache.sqlite"), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS lookup_cache "
+        "(regi_id TEXT PRIMARY KEY, results TEXT NOT NULL, fetched_at REAL NOT NULL)"
+    )
+    conn.commit()
+    return conn
+
+
+def cache_oldest(ttl_days):
+    """ttl_days 天前的時間；ttl_days <= 0 表示永不過期"""
+    return time.time() - ttl_days * 86400 if ttl_days and ttl_days > 0 else 0
+
+
+def lookup_cache_get_many(conn, values, ttl_days, no_data_ttl_days=1):
+    """取出未過期的快取結果：{編號: 結果}；「查無資料」以較短的 no_data_ttl_days 計算（新登記的工廠很快就查得到）"""
+    if conn is None or not values:
+        return {}
+    oldest = cache_oldest(ttl_days)
+    no_data_oldest = max(oldest, cache_oldest(no_data_ttl_days))
+    cached = {}
+    values = list(values)
+    for start in range(0, len(values), 500):  # SQLite 參數數量有上限，分批查詢
+        chunk = values[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        for regi_id, results, fetched_at in conn.execute(
+            f"SELECT regi_id, results, fetched_at FROM lookup_cache "
+            f"WHERE fetched_at >= ? AND regi_id IN ({placeholders})",
+            (oldest, *chunk),
+        ):
+            results = json.loads(results)
+            if results == ['查無資料'] and fetched_at < no_data_oldest:
+                continue
+            cached[regi_id] = results
+    return cached
+
+
+def lookup_cache_put(conn, regi_id, results):
+    """只快取完整結果與確認過結果清單的「查無資料」，查詢失敗的編號下次重新查詢"""
+    if conn is None or not results:
+        return
+    if len(results) != CACHEABLE_RESULT_LENGTH and results != ['查無資料']:
+        return
+    conn.execute(
+        "INSERT OR REPLACE INTO lookup_cache (regi_id, results, fetched_at) VALUES (?, ?, ?)",
+        (regi_id, json.dumps(results, ensure_ascii=False), time.time()),
+    )
+    conn.commit()
+
+
+def lookup_journal_path(file_path):
+    return f"{file_path}.journal.jsonl"
+
+
+def search_values_digest(rows):
+    """查詢欄內容的雜湊，用來確認日誌是否屬於同一份 Excel（每次擷取都會重建 Excel，路徑相同不代表內容相同）"""
+    values = [value for _, value in rows]
+    return hashlib.sha256(json.dumps(values, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def read_lookup_journal(path, workbook_digest):
+    """讀取上次中斷前已查詢的結果：{編號: 結果}；日誌屬於其他內容的 Excel 時回傳空 dict，最後一行若寫到一半則略過"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if line_number == 0:
+                if entry.get("workbook") != workbook_digest:
+                    return {}
+                continue
+            done[entry["regi_id"]] = entry["results"]
+    return done
+
+
+def open_lookup_journal(path, workbook_digest, resume):
+    """開啟日誌；不接續時清空並在第一行記錄 Excel 查詢欄的雜湊"""
+    if resume:
+        return open(path, "a", encoding="utf-8")
+    journal = open(path, "w", encoding="utf-8")
+    journal.write(json.dumps({"workbook": workbook_digest}) + "\n")
+    journal.flush()
+    return journal
+
+
+def append_lookup_journal(journal, regi_id, results):
+    """每筆結果立即寫入日誌（append-only），中斷後可從日誌接續"""
+    journal.write(json.dumps({"regi_id": regi_id, "results": results}, ensure_ascii=False) + "\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+def read_search_values(worksheet, search_col, max_rows=10000):
+    """讀取查詢欄，遇到空白列為止；回傳 [(列號, 值), ...]"""
+    rows = []
+    for row_index in range(2, max_rows + 2):  # 從第二行開始，最多處理 10000 行
+        main_search_value = str(worksheet[f'{get_column_letter(search_col)}{row_index}'].value)
+        if main_search_value == 'None':
+            break
+        rows.append((row_index, main_search_value))
+    return rows
+
+
+def split_search_value(value):
+    """擷取結果的工廠編號欄可能有多個編號（以逗號分隔）或「無」，拆成要查詢的編號清單"""
+    return list(dict.fromkeys(number for number in re.split(r'[,，\s]+', value) if number and number != '無'))
+
+
+def process_excel_data(file_path, search_col=1, config=None, refresh=False, split_numbers=False):
+    """從 Excel 讀取資料，同時查詢不重複的編號，並依列寫回 Excel。
+
+    split_numbers 為 True 時（批次模式沒有人工只留一個編號的步驟）每格拆成多個編號分別查詢，
+    各欄位以換行依編號順序列出結果；「無」不查詢。
+
+    query_backend 為 http 時先以 HTTP 查詢，失敗的編號再交給瀏覽器。
+    有效期限內的查詢快取直接填入；refresh 為 True 時全部重新查詢。
+    每筆結果先寫入日誌，Excel 每 query_save_every 筆或 query_save_seconds 秒存一次；
+    中途中斷時，下次執行會從日誌接續，不重查已完成的編號；日誌記錄查詢欄內容的雜湊，
+    Excel 內容不同（例如重新擷取）或 refresh 時不接續。
+    """
+    config = config or {}
+    refresh = refresh or config.get("lookup_refresh", False)
+    sessions = config.get("query_sessions", 1)
+    retries = config.get("query_retries", 2)
+
     workbook = safe_load_workbook(file_path)
     worksheet = workbook.active
 
@@ -89,54 +498,117 @@ def process_excel_data(file_path, search_col=1):
         col = get_column_letter(search_col + index + 1)  # search_col 為 D，+1 為 E 開始
         worksheet[f'{col}1'] = header
 
-    row_count = 0
+    rows = read_search_values(worksheet, search_col)
+    row_count = rows[-1][0] + 1 if rows else 2
 
-    for row_index in range(2, 10002):  # 從第二行開始，最多處理 10000 行
-        row_count = row_index
-        main_search_value = str(worksheet[f'{get_column_letter(search_col)}{row_index}'].value)
+    # 同一個編號只查一次，結果寫回所有出現的列
+    numbers_by_row = {row_index: split_search_value(value) if split_numbers else [value] for row_index, value in rows}
+    rows_by_value = {}
+    for row_index, numbers in numbers_by_row.items():
+        for value in numbers:
+            rows_by_value.setdefault(value, []).append(row_index)
+    results_by_value = {}
 
-        if main_search_value == 'None':
-            break
+    def result_field(value, index):
+        search_results = results_by_value.get(value) or []
+        return search_results[index] if index < len(search_results) else ''
 
-        print(f'Submiting {row_count-1} : {main_search_value}')
+    def fill_rows(value, search_results):
+        results_by_value[value] = search_results or ['查詢失敗']
+        for row_index in rows_by_value[value]:
+            numbers = numbers_by_row[row_index]
+            if len(numbers) == 1:
+                row_results = results_by_value[value]
+            else:
+                # 一格多個編號：每個欄位逐行對應編號順序，尚未查詢的編號先留空行
+                row_results = ["\n".join(result_field(number, index) for number in numbers)
+                               for index in range(len(result_headers))]
+            for index, res in enumerate(row_results):
+                worksheet[f'{get_column_letter(search_col + index + 1)}{row_index}'] = res
 
-        search_input = driver.find_element(By.NAME, 'regiID')
-        search_input.clear()
-        search_input.send_keys(main_search_value)
-        search_input.send_keys(Keys.RETURN)
+    journal_path = lookup_journal_path(file_path)
+    workbook_digest = search_values_digest(rows)
+    journal_results = {} if refresh else read_lookup_journal(journal_path, workbook_digest)
+    resumed = {
+        value: search_results
+        for value, search_results in journal_results.items()
+        if value in rows_by_value
+    }
+    if resumed:
+        print(f'從上次中斷處繼續：已查詢 {len(resumed)} 筆')
 
-        search_results = []
-        if handle_alert(driver):
-            search_results.append('資料無法查詢')
-        else:
-            driver.switch_to.parent_frame()
-            result_frame = driver.find_element(By.NAME, 'show')
-            driver.switch_to.frame(result_frame)
-            search_results = perform_web_search(driver, wait)
+    cache = open_lookup_cache(config)
+    remaining = [value for value in rows_by_value if value not in resumed]
+    cached = {} if refresh else lookup_cache_get_many(cache, remaining, config.get("lookup_cache_ttl_days", 30),
+                                                          config.get("lookup_cache_no_data_ttl_days", 1))
+    if cache is not None:
+        print(f'查詢快取：命中 {len(cached)} 筆，需查詢 {len(remaining) - len(cached)} 筆'
+              + ('（強制重新查詢）' if refresh else ''))
+    for value, search_results in {**resumed, **cached}.items():
+        fill_rows(value, search_results)
 
-        for index, res in enumerate(search_results):
-            worksheet[f'{get_column_letter(search_col + index + 1)}{row_index}'] = res
+    save_every = max(1, config.get("query_save_every", 50))
+    save_seconds = config.get("query_save_seconds", 30)
+    unsaved = len(resumed) + len(cached)
+    last_save = time.time()
+    journal = open_lookup_journal(journal_path, workbook_digest, resume=bool(journal_results))
 
-        #workbook.save(file_path)
-        safe_save_workbook(workbook, file_path)
+    def write_result(value, search_results):
+        nonlocal unsaved, last_save
+        fill_rows(value, search_results)
+        if search_results is not None:
+            append_lookup_journal(journal, value, search_results)
+        lookup_cache_put(cache, value, search_results)
 
+        # 結果已在日誌中，Excel 分批存檔即可
+        unsaved += 1
+        if unsaved >= save_every or time.time() - last_save >= save_seconds:
+            safe_save_workbook(workbook, file_path)
+            unsaved, last_save = 0, time.time()
 
+    client = make_lookup_backend(config)
+    pool = DriverPool(config.get("registry_url", REGISTRY_URL))
+    try:
+        pending = [value for value in remaining if value not in cached]
+        if client is not None and pending:
+            failed = []
+            for value, search_results in run_lookups(client, pending, config.get("query_http_concurrency", 8), retries):
+                if search_results is None:
+                    failed.append(value)
+                else:
+                    write_result(value, search_results)
+            if failed:
+                print(f'HTTP 查詢失敗 {len(failed)} 筆，改用瀏覽器查詢')
+            pending = failed
+
+        for value, search_results in run_lookups(pool, pending, sessions, retries):
+            write_result(value, search_results)
+    finally:
+        journal.close()
+        if client is not None:
+            client.close()
+        pool.close()
+        if cache is not None:
+            cache.close()
+
+    #workbook.save(file_path)
+    safe_save_workbook(workbook, file_path)
+    os.remove(journal_path)  # Excel 已完整寫入，不需要再接續
     workbook.close()
-    driver.quit()  # 關閉瀏覽器
     print('查詢結束，請至 Excel 確認結果')
     return row_count
 
+
 def perform_web_search(driver,wait):
     """在網頁上進行搜尋，並擷取結果。"""
     try:
-        wait.until(EC.visibility_of_element_located((By.XPATH, '/html/body/form/table/tbody/tr/td/table[2]/tbody/tr[1]/th[2]/font/h2')))
+        wait.until(EC.visibility_of_element_located((By.XPATH, RESULT_TITLE_XPATH)))
     except Exception:
-        pass
+        raise TimeoutError('查詢結果頁未載入')  # 不是結果清單時不能當成查無資料
 
     results = []
-    result_link_xpath = '/html/body/form/table/tbody/tr/td/table[2]/tbody/tr[2]/td[2]/h3/a'
     try:
-        result_link = driver.find_element(By.XPATH, result_link_xpath)
+        result_link = driver.find_element(By.XPATH, RESULT_LINK_XPATH)
         result_link.click()
     except:
         results.append('查無資料')
@@ -147,21 +619,12 @@ def perform_web_search(driver,wait):
         
     driver.switch_to.parent_frame()
     try:
-        wait.until(EC.visibility_of_element_located((By.XPATH, '/html/body/form/div/div[2]/div/div[3]/h2/b/font')))
+        wait.until(EC.visibility_of_element_located((By.XPATH, DETAIL_TITLE_XPATH)))
     except Exception:
         raise TimeoutError('連線逾時')
 
-    factory_name = driver.find_element(By.XPATH, '//*[@id="factInfoMain"]/b/font').text
-    factory_number = driver.find_element(By.XPATH, '//*[@id="AutoNumber4"]/tbody/tr[1]/td[1]/font').text
-    factory_address = driver.find_element(By.XPATH, '//*[@id="AutoNumber4"]/tbody/tr[2]/td/font').text
-    factory_status = driver.find_element(By.XPATH, '//*[@id="AutoNumber4"]/tbody/tr[7]/td/font').text
-    factory_location = driver.find_element(By.XPATH, '//*[@id="AutoNumber4"]/tbody/tr[3]/td[1]/font').text
-
-    results.append(factory_location)
-    results.append(factory_name)
-    results.append(factory_address)
-    results.append(factory_number)
-    results.append(factory_status)
+    for xpath in RESULT_FIELD_XPATHS:
+        results.append(driver.find_element(By.XPATH, xpath).text)
 
     driver.back()
     driver.switch_to.parent_frame()
@@ -172,7 +635,12 @@ def perform_web_search(driver,wait):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="查詢工廠編號並寫回 Excel")
+    parser.add_argument("--refresh", action="store_true", help="忽略查詢快取，全部重新查詢")
+    args = parser.parse_args()
     config = load_config()
+    start_trace(config)
     
-    processed_rows = process_excel_data(config, 4)
+    processed_rows = process_excel_data(config['output_excel'], 4, config, refresh=args.refresh)
+    export_trace()
     input(f'查詢了 {processed_rows - 2} 筆，任務完成')
\ No newline at end of file
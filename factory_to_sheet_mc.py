@@ -1,14 +1,23 @@
-from pdf2image import convert_from_path
 import fitz
-from openpyxl import load_workbook
+import cv2
+import numpy as np
+from openpyxl import Workbook
 import pandas as pd
 import pytesseract
 import json
 import os
 import re
-from concurrent.futures import ProcessPoolExecutor
+import time
+import hashlib
+import sqlite3
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import multiprocessing
 from functools import partial
+from tracing import span
+from memory_budget import memory_budget_enabled, raster_channels, capped_dpi, plan_workers
+from number_regions import find_number_runs, run_crop, to_gray
+from preprocess import PREPROCESS_KEYS, preprocess_enabled, preprocess_image
 
 
 def load_config(config_path="config.json"):
@@ -22,52 +31,496 @@ def ensure_tesseract_path(config):
         pytesseract.pytesseract.tesseract_cmd = tesseract_path
 
 
-def preprocess_image(image):
-    gray_image = image.convert('L')
-    binary_image = gray_image.point(lambda x: 0 if x < 175 else 255, '1')
-    return binary_image
+def render_page_array(page, dpi=72, gray=False):
+    """以 PyMuPDF 直接將頁面渲染成 NumPy 陣列（不經 PNG 編解碼）"""
+    colorspace = fitz.csGRAY if gray else fitz.csRGB
+    with span("render", page=page.number, dpi=dpi):
+        pix = page.get_pixmap(dpi=dpi, colorspace=colorspace, alpha=False)
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    return img[:, :, 0] if gray else img
+
+
+def render_ocr_image(page, config, dpi=None):
+    """OCR 用影像（預設以 dpi 渲染）；記憶體預算模式下以灰階（budget_color_mode 為 mono 時再二值化）渲染並限制單張大小"""
+    dpi = dpi or config.get("dpi", 300)
+    if not memory_budget_enabled(config):
+        return render_page_array(page, dpi=dpi)
+
+    mode = config.get("budget_color_mode", "gray")
+    dpi = capped_dpi(page.rect.width, page.rect.height, dpi, raster_channels(config), config)
+    img = render_page_array(page, dpi=dpi, gray=mode != "rgb")
+    if mode == "mono":
+        _, img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    return img
+
+
+def prepare_ocr_image(image, config):
+    """開啟 preprocess 時回傳前處理後的 OCR 影像（見 preprocess.preprocess_image），否則原樣回傳"""
+    if not preprocess_enabled(config):
+        return image
+    with span("preprocess"):
+        return preprocess_image(image, config)[1]
+
+
+# 每個 worker 常駐的 tesserocr 引擎，依語言與參數各一個（整個執行期間只初始化一次）
+_TESS_APIS = {}
+_TESSEROCR_UNAVAILABLE = False
+
+
+def parse_tesseract_config(settings):
+    """解析 "--oem 1 --psm 6 -c name=value" 形式的參數"""
+    oem, psm, variables = None, None, {}
+    tokens = settings.split()
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == "--oem" and i + 1 < len(tokens):
+            oem = int(tokens[i + 1])
+            i += 1
+        elif token == "--psm" and i + 1 < len(tokens):
+            psm = int(tokens[i + 1])
+            i += 1
+        elif token == "-c" and i + 1 < len(tokens) and "=" in tokens[i + 1]:
+            name, value = tokens[i + 1].split("=", 1)
+            variables[name] = value
+            i += 1
+        i += 1
+    return oem, psm, variables
+
+
+def get_tesserocr_api(config):
+    """取得目前行程的 tesserocr 引擎；無法使用時回傳 None，改用 pytesseract"""
+    global _TESSEROCR_UNAVAILABLE
+    lang = config.get("tesseract_lang", "chi_tra")
+    settings = config.get("tesseract_config", "")
+    oem, psm, variables = parse_tesseract_config(settings)
 
+    tessdata = os.path.join(config.get("tesseract_path", "").strip(), "tessdata")
+    tessdata = tessdata if os.path.isdir(tessdata) else None
 
-def pdf_to_text(pdf_path, config):
-    doc = fitz.open(pdf_path)
-    full_text = ""
+    key = (lang, settings, tessdata)
+    if key in _TESS_APIS:
+        return _TESS_APIS[key]
+    if _TESSEROCR_UNAVAILABLE:
+        return None
+
+    try:
+        import tesserocr
+        kwargs = {"lang": lang}
+        if tessdata:
+            kwargs["path"] = tessdata
+        if oem is not None:
+            kwargs["oem"] = oem
+        api = tesserocr.PyTessBaseAPI(**kwargs)
+    except (ImportError, RuntimeError) as e:
+        print(f"[警告] 無法使用 tesserocr（{e}），改用 pytesseract。")
+        _TESSEROCR_UNAVAILABLE = True
+        return None
+
+    if psm is not None:
+        api.SetPageSegMode(psm)
+    for name, value in variables.items():
+        api.SetVariable(name, value)
+
+    _TESS_APIS[key] = api
+    return api
+
+
+def tesserocr_image_to_string(api, image):
+    """將影像直接交給常駐引擎辨識，不寫暫存檔"""
+    if isinstance(image, np.ndarray):
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        bytes_per_pixel = 1 if image.ndim == 2 else image.shape[2]
+        api.SetImageBytes(image.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+    else:
+        api.SetImage(image)
+    return api.GetUTF8Text()
+
+
+def tesseract_ocr(image, config):
+    """以 tesseract_lang、tesseract_config 辨識整張影像"""
+    if config.get("ocr_backend", "pytesseract") == "tesserocr":
+        api = get_tesserocr_api(config)
+        if api is not None:
+            return tesserocr_image_to_string(api, image)
+
+    settings = config.get("tesseract_config", "")
+    lang = config.get("tesseract_lang", "chi_tra")
+    return pytesseract.image_to_string(image, lang=lang, config=settings)
+
+
+def tesseract_data_to_text(data):
+    """將 image_to_data 的逐字結果依段落、行組回文字"""
+    lines = []
+    current = None
+    for i, word in enumerate(data["text"]):
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if key != current:
+            current = key
+            lines.append([])
+        if word.strip():
+            lines[-1].append(word)
+    return "\n".join(" ".join(words) for words in lines if words)
+
+
+def tesseract_ocr_with_confidence(image, config):
+    """辨識整張影像並回傳 (文字, 平均信心 0~100)；沒有辨識出任何字時信心為 0"""
+    if config.get("ocr_backend", "pytesseract") == "tesserocr":
+        api = get_tesserocr_api(config)
+        if api is not None:
+            text = tesserocr_image_to_string(api, image)
+            return text, api.MeanTextConf()
 
     settings = config.get("tesseract_config", "")
     lang = config.get("tesseract_lang", "chi_tra")
-    dpi = config.get("dpi", 300)
+    data = pytesseract.image_to_data(image, lang=lang, config=settings, output_type=pytesseract.Output.DICT)
+    confidences = [float(conf) for conf, word in zip(data["conf"], data["text"]) if word.strip() and float(conf) >= 0]
+    confidence = sum(confidences) / len(confidences) if confidences else 0
+    return tesseract_data_to_text(data), confidence
+
 
-    for i, page in enumerate(doc):
-        text = page.get_text("text")
-        if not text.strip():
-            images = convert_from_path(pdf_path, dpi=dpi,poppler_path=config["poppler_path"])
-            text = pytesseract.image_to_string(images[i], lang=lang, config=settings)
+def number_ocr_config(config):
+    """編號區域使用的 OCR 設定：預設為英文模型、單行模式、只允許數字與 S"""
+    return dict(config, tesseract_lang=config.get("number_ocr_lang", "eng"),
+                tesseract_config=config.get("number_ocr_config",
+                                            "--oem 1 --psm 7 -c tessedit_char_whitelist=0123456789S"))
+
+
+def ocr_number_regions(image, config):
+    """
+    只辨識頁面上的編號區域（見 number_regions.find_number_runs），回傳 (文字, 平均信心)。
+
+    每個區域一行，區域內以空白隔開的片段也各自一行（避免兩個編號黏在一起）；
+    找不到區域或辨識結果不含發文字號、工廠編號時回傳 None。
+    """
+    with span("number_regions"):
+        runs = find_number_runs(image, config.get("number_min_digits", 6))
+    if not runs:
+        return None
+
+    gray = to_gray(image)
+    number_config = number_ocr_config(config)
+    lines, confidences = [], []
+    for run in runs:
+        text, confidence = tesseract_ocr_with_confidence(run_crop(gray, run), number_config)
+        text = "\n".join(text.split())
+        if text:
+            lines.append(text)
+            confidences.append(confidence)
+
+    text = "\n".join(lines)
+    if not has_number_match(text, config):
+        return None
+    return text, sum(confidences) / len(confidences)
+
+
+def ocr_image(image, config):
+    """對單張頁面影像進行 OCR；ocr_mode 為 numbers 時先只辨識編號區域，找不到才辨識整頁"""
+    if config.get("ocr_mode", "full") == "numbers":
+        found = ocr_number_regions(image, config)
+        if found is not None:
+            return found[0]
+    return tesseract_ocr(image, config)
+
+
+def ocr_image_with_confidence(image, config):
+    """OCR 並回傳 (文字, 平均信心 0~100)，編號區域模式同 ocr_image"""
+    if config.get("ocr_mode", "full") == "numbers":
+        found = ocr_number_regions(image, config)
+        if found is not None:
+            return found
+    return tesseract_ocr_with_confidence(image, config)
+
+
+def first_ocr_dpi(config):
+    """第一輪 OCR 的解析度：開啟 adaptive_ocr 時為 ocr_low_dpi，否則為 dpi"""
+    if config.get("adaptive_ocr", False):
+        return config.get("ocr_low_dpi", 150)
+    return config.get("dpi", 300)
+
+
+def view_render_dpi(config):
+    """
+    單次渲染流程中無文字層頁面的渲染解析度，空白判斷與大印比對的 72 dpi 影像由此縮小而成：
+    記憶體預算模式直接以 72 dpi 渲染，否則為第一輪 OCR 的解析度
+    """
+    return 72 if memory_budget_enabled(config) else first_ocr_dpi(config)
+
+
+def has_number_match(text, config):
+    """文字中找得到發文字號或工廠編號"""
+    rules = get_extraction_rules(config)
+    return bool(rules["document_number_pattern"].search(text) or rules["factory_number_pattern"].search(text))
+
+
+def ocr_result_acceptable(text, confidence, config):
+    """低解析度結果可採用：平均信心達 ocr_min_confidence，且找得到發文字號或工廠編號"""
+    return confidence >= config.get("ocr_min_confidence", 70) and has_number_match(text, config)
+
+
+def ocr_adaptive(image, render_full, config, **span_args):
+    """
+    對第一輪影像（依 first_ocr_dpi 渲染）進行 OCR，回傳 (文字, 是否提高解析度)。
+
+    開啟 adaptive_ocr 時先以低解析度辨識，結果不合格（見 ocr_result_acceptable）
+    才呼叫 render_full() 以 dpi 重新渲染並辨識。
+    """
+    if not config.get("adaptive_ocr", False):
+        with span("ocr", dpi=config.get("dpi", 300), **span_args):
+            return ocr_image(image, config), False
+
+    with span("ocr", dpi=first_ocr_dpi(config), **span_args):
+        text, confidence = ocr_image_with_confidence(image, config)
+    if ocr_result_acceptable(text, confidence, config):
+        return text, False
+
+    image = render_full()
+    with span("ocr", dpi=config.get("dpi", 300), escalated=True, **span_args):
+        return ocr_image(image, config), True
+
+
+def print_ocr_escalation(ocr_pages, escalated_pages, config):
+    if config.get("adaptive_ocr", False) and ocr_pages:
+        print(f"自適應 OCR：{ocr_pages} 頁中 {escalated_pages} 頁提高解析度重新辨識"
+              f"（{escalated_pages / ocr_pages:.0%}，{first_ocr_dpi(config)} → {config.get('dpi', 300)} dpi）")
+
+
+# 每個行程各自的 OCR 快取連線
+_OCR_CACHE_CONN = None
+
+
+def page_content_hash(page):
+    """以頁面內容串流與內嵌影像的原始資料計算雜湊（分割前後同一頁結果相同）"""
+    digest = hashlib.sha256()
+    digest.update(f"{tuple(page.rect)}|{page.rotation}|".encode())
+    digest.update(page.read_contents())
+    for image in page.get_images(full=True):
+        digest.update(page.parent.xref_stream_raw(image[0]) or b"")
+    return digest.hexdigest()
+
+
+def ocr_render_key(config, page=None):
+    """
+    記憶體預算模式下 OCR 影像的渲染方式（見 render_ocr_image），一般模式回傳空字串。
+
+    指定 page 時為色彩模式與該頁實際渲染的 dpi（受 raster_budget_mb 限制）；
+    未指定時（整份工作的設定指紋）以 raster_budget_mb 代替各頁的 dpi。
+    """
+    if not memory_budget_enabled(config):
+        return ""
+    key = f'|budget:{config.get("budget_color_mode", "gray")}'
+    if page is None:
+        return key + f':{config.get("raster_budget_mb", 32)}'
+    dpis = [capped_dpi(page.rect.width, page.rect.height, dpi, raster_channels(config), config)
+            for dpi in (first_ocr_dpi(config), config.get("dpi", 300))]
+    return key + ":" + ",".join(str(dpi) for dpi in dpis)
+
+
+def ocr_settings_key(config, page=None):
+    """會影響 OCR 結果的設定（指定 page 時含該頁在記憶體預算模式下的實際 dpi）"""
+    key = (f'{config.get("dpi", 300)}|{config.get("tesseract_lang", "chi_tra")}|{config.get("tesseract_config", "")}'
+           f'|{config.get("ocr_backend", "pytesseract")}')
+    key += ocr_render_key(config, page)
+    if config.get("adaptive_ocr", False):
+        key += f'|adaptive:{config.get("ocr_low_dpi", 150)}:{config.get("ocr_min_confidence", 70)}'
+    if preprocess_enabled(config):
+        key += "|preprocess:" + ",".join(str(config.get(name)) for name in PREPROCESS_KEYS)
+    if config.get("ocr_mode", "full") == "numbers":
+        number_config = number_ocr_config(config)
+        key += (f'|numbers:{number_config["tesseract_lang"]}:{number_config["tesseract_config"]}'
+                f':{config.get("number_min_digits", 6)}')
+    return key
+
+
+def ocr_cache_key(page, config):
+    return hashlib.sha256(f"{page_content_hash(page)}|{ocr_settings_key(config, page)}".encode()).hexdigest()
+
+
+def get_ocr_cache(config):
+    """取得 OCR 快取連線，未啟用時回傳 None"""
+    global _OCR_CACHE_CONN
+    if not config.get("ocr_cache", False):
+        return None
+    if _OCR_CACHE_CONN is None:
+        _OCR_CACHE_CONN = sqlite3.connect(config.get("ocr_cache_path", "ocr_cache.sqlite"), timeout=30)
+        _OCR_CACHE_CONN.execute("PRAGMA journal_mode=WAL")
+        _OCR_CACHE_CONN.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_cache "
+            "(key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        _OCR_CACHE_CONN.commit()
+    return _OCR_CACHE_CONN
+
+
+def ocr_cache_get(key, config):
+    conn = get_ocr_cache(config)
+    if conn is None:
+        return None
+    row = conn.execute("SELECT text FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    conn.execute("UPDATE ocr_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+    conn.commit()
+    return row[0]
+
+
+def ocr_cache_put(key, text, config):
+    conn = get_ocr_cache(config)
+    if conn is None:
+        return
+    conn.execute(
+        "INSERT OR REPLACE INTO ocr_cache (key, text, size, last_used) VALUES (?, ?, ?, ?)",
+        (key, text, len(text.encode("utf-8")), time.time()),
+    )
+    conn.commit()
+
+
+def prune_ocr_cache(config):
+    """快取超過 ocr_cache_max_mb 時，從最久未使用的項目開始刪除"""
+    conn = get_ocr_cache(config)
+    if conn is None:
+        return
+    max_bytes = config.get("ocr_cache_max_mb", 200) * 1024 * 1024
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+    if total <= max_bytes:
+        return
+
+    expired = []
+    for key, size in conn.execute("SELECT key, size FROM ocr_cache ORDER BY last_used"):
+        if total <= max_bytes:
+            break
+        expired.append((key,))
+        total -= size
+    conn.executemany("DELETE FROM ocr_cache WHERE key = ?", expired)
+    conn.commit()
+    print(f"OCR 快取已清除 {len(expired)} 筆最久未使用的結果")
+
+
+def page_to_text(page, config, stats=None):
+    """
+    取得單頁文字，無文字層時只渲染這一頁進行 OCR（有快取則直接取用）。
+
+    stats 為 dict 時累計 OCR 頁數（ocr）與提高解析度的頁數（escalated）。
+    """
+    text = page.get_text("text")
+    if not text.strip():
+        key = ocr_cache_key(page, config) if config.get("ocr_cache", False) else None
+        cached = ocr_cache_get(key, config) if key else None
+        if cached is not None:
+            return cached
+        image = prepare_ocr_image(render_ocr_image(page, config, dpi=first_ocr_dpi(config)), config)
+        text, escalated = ocr_adaptive(image, lambda: prepare_ocr_image(render_ocr_image(page, config), config),
+                                       config, page=page.number, file=os.path.basename(page.parent.name))
+        if stats is not None:
+            stats["ocr"] = stats.get("ocr", 0) + 1
+            stats["escalated"] = stats.get("escalated", 0) + escalated
+        if key:
+            ocr_cache_put(key, text, config)
+    return text
+
+
+def join_page_texts(page_texts):
+    """依頁序合併各頁文字"""
+    full_text = ""
+    for i, text in enumerate(page_texts):
         full_text += f"--- 第 {i + 1} 頁 ---\n{text}\n"
     return full_text
 
 
+def pdf_to_text(pdf_path, config):
+    with fitz.open(pdf_path) as doc:
+        return join_page_texts([page_to_text(page, config) for page in doc])
+
+
+def ocr_pdf_page(pdf_file, page_index, config):
+    """取得單一頁面的文字，並回傳執行的 worker、起訖時間與 OCR 統計"""
+    ensure_tesseract_path(config)
+    start = time.time()
+    stats = {}
+    with fitz.open(pdf_file) as doc:
+        text = page_to_text(doc[page_index], config, stats)
+    return pdf_file, page_index, text, os.getpid(), start, time.time(), stats
+
+
+def print_worker_utilization(spans, wall_seconds):
+    """顯示各 worker 忙碌時間佔整段執行時間的比例"""
+    busy = defaultdict(float)
+    pages = defaultdict(int)
+    for pid, start, end in spans:
+        busy[pid] += end - start
+        pages[pid] += 1
+
+    print(f"\nWorker 使用率（總耗時 {wall_seconds:.1f} 秒）：")
+    for pid in sorted(busy):
+        utilization = busy[pid] / wall_seconds if wall_seconds else 0
+        print(f"  PID {pid}: {utilization:>6.1%}，{pages[pid]} 頁")
+
+
 def extract_pdf_data(pdf_path, config):
     text = pdf_to_text(pdf_path, config)
-    exclude_path = config.get("exclude_path", "exclude_numbers.txt")
+    with span("extract", document=os.path.basename(pdf_path)):
+        return extract_text_data(text, config)
 
+
+# 每個行程各自的擷取規則（正規表示式只編譯一次，排除清單依修改時間重新載入）
+_EXTRACTION_RULES = None
+
+
+def load_exclude_set(exclude_path):
+    """讀取排除清單，只保留 8 碼數字；回傳 (frozenset, 修改時間)"""
     try:
+        mtime = os.path.getmtime(exclude_path)
         with open(exclude_path, "r", encoding="utf-8") as f:
-            exclude_set = set(line.strip() for line in f if re.fullmatch(r"\d{8}", line.strip()))
+            exclude_set = frozenset(
+                number for number in (line.strip() for line in f)
+                if len(number) == 8 and number.isdecimal()
+            )
     except FileNotFoundError:
-        exclude_set = set()
+        return frozenset(), None
+    return exclude_set, mtime
 
-    document_number_pattern = config["document_number_pattern"]
-    factory_number_pattern = config["factory_number_pattern"]
 
-    document_number_match = re.search(document_number_pattern, text)
+def get_extraction_rules(config):
+    """取得編譯好的擷取規則；設定變更或排除清單檔案更新時才重新載入"""
+    global _EXTRACTION_RULES
+    exclude_path = config.get("exclude_path", "exclude_numbers.txt")
+    source = (config["document_number_pattern"], config["factory_number_pattern"], exclude_path)
+
+    rules = _EXTRACTION_RULES
+    if rules is None or rules["source"] != source:
+        exclude_set, mtime = load_exclude_set(exclude_path)
+        rules = {
+            "source": source,
+            "document_number_pattern": re.compile(config["document_number_pattern"]),
+            "factory_number_pattern": re.compile(config["factory_number_pattern"]),
+            "exclude_set": exclude_set,
+            "exclude_mtime": mtime,
+        }
+        _EXTRACTION_RULES = rules
+    else:
+        try:
+            mtime = os.path.getmtime(exclude_path)
+        except OSError:
+            mtime = None
+        if mtime != rules["exclude_mtime"]:
+            rules["exclude_set"], rules["exclude_mtime"] = load_exclude_set(exclude_path)
+    return rules
+
+
+def extract_text_data(text, config):
+    """從 OCR 文字擷取發文字號與工廠編號"""
+    rules = get_extraction_rules(config)
+    exclude_set = rules["exclude_set"]
+
+    document_number_match = rules["document_number_pattern"].search(text)
     document_number = f"府經工行字第{document_number_match.group(1)}號" if document_number_match else "未匹配"
 
-    matches = re.findall(factory_number_pattern, text)
+    matches = rules["factory_number_pattern"].findall(text)
     factory_numbers = [m1 if m1 else m2 for m1, m2 in matches]
 
-    filtered_factory_numbers = [
-        num for num in factory_numbers
-        if not (re.fullmatch(r"\d{8}", num) and num in exclude_set)
-    ]
+    # 排除清單只含 8 碼數字，S 開頭的編號不會被排除
+    filtered_factory_numbers = [num for num in factory_numbers if num not in exclude_set]
 
     unique_factory_numbers = sorted(set(filtered_factory_numbers))
     factory_numbers_result = ", ".join(unique_factory_numbers) if unique_factory_numbers else "無"
@@ -84,58 +537,138 @@ def process_single_pdf(pdf_file, config):
     return data
 
 
-def process_folder_multiprocessing(config):
+def extract_document(name, page_texts, config):
+    """合併一份文件各頁文字並擷取資料"""
+    with span("extract", document=name):
+        data = extract_text_data(join_page_texts(page_texts), config)
+    data["檔名"] = name
+    print(f"\rProcessed: {name:<60}")
+    return data
+
+
+def extract_documents_multiprocessing(documents, config):
+    """
+    以頁為單位排程 OCR，一份文件的頁面全部完成後立即擷取，最後存成 Excel。
+
+    Args:
+        documents: List[(檔名, pdf_path, 頁碼清單)]，可以是各自的分割檔，
+                   也可以是同一份 PDF 的不同頁碼區段。
+    """
     ensure_tesseract_path(config)
 
-    folder_path = config['process_folder']
     output_excel = config['output_excel']
     max_processes = config["max_processes"]
 
     cpu_count = multiprocessing.cpu_count()
     if max_processes is None:
         max_processes = max(1, cpu_count - 1)
+    max_processes = plan_workers(config, max_processes)
+
+    # 以頁為單位排程，長文件的頁面會分散到所有 worker
+    page_texts = [[None] * len(pages) for _, _, pages in documents]
+    remaining = [len(pages) for _, _, pages in documents]
+    extracted_data = [extract_document(name, [], config) for name, _, pages in documents if not pages]
+
+    spans = []
+    ocr_stats = {"ocr": 0, "escalated": 0}
+    total_pages = sum(remaining)
+    wall_start = time.time()
+    with ProcessPoolExecutor(max_workers = max_processes) as executor:
+        job = partial(ocr_pdf_page, config=config)
+        futures = {}
+        for doc_index, (_, pdf_path, pages) in enumerate(documents):
+            for position, page_index in enumerate(pages):
+                futures[executor.submit(job, pdf_path, page_index)] = (doc_index, position)
+
+        # 依完成順序處理，慢的文件不會擋住後面的進度
+        for future in as_completed(futures):
+            _, _, text, pid, start, end, stats = future.result()
+            for name, count in stats.items():
+                ocr_stats[name] += count
+            doc_index, position = futures[future]
+            page_texts[doc_index][position] = text
+            spans.append((pid, start, end))
+
+            remaining[doc_index] -= 1
+            if remaining[doc_index] == 0:
+                extracted_data.append(extract_document(documents[doc_index][0], page_texts[doc_index], config))
+            print_progress(len(spans), total_pages, wall_start, len(extracted_data), len(documents))
+
+    print()
+    print_worker_utilization(spans, time.time() - wall_start)
+    print_ocr_escalation(ocr_stats["ocr"], ocr_stats["escalated"], config)
+    prune_ocr_cache(config)
+
+    save_extraction_results(extracted_data, output_excel)
+
+
+def process_folder_multiprocessing(config):
+    folder_path = config['process_folder']
 
     if not os.path.exists(folder_path):
         raise FileNotFoundError(f"❌ 找不到指定資料夾：{folder_path}")
 
-    pdf_files = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith(".pdf")]
-    extracted_data = []
+    documents = []
+    for f in os.listdir(folder_path):
+        if f.endswith(".pdf"):
+            pdf_file = os.path.join(folder_path, f)
+            with fitz.open(pdf_file) as doc:
+                documents.append((f, pdf_file, list(range(doc.page_count))))
 
-    with ProcessPoolExecutor(max_workers = max_processes) as executor:
-        job = partial(process_single_pdf, config=config)
-        futures = [executor.submit(job, pdf_file) for pdf_file in pdf_files]
-        for future in futures:
-            extracted_data.append(future.result())
-            print(f"Processed: {extracted_data[-1]['檔名']}")
+    extract_documents_multiprocessing(documents, config)
 
-    # 將結果保存為 Excel 文件
-    df = pd.DataFrame(extracted_data)
-    
-    # 擷取檔名中的數字編號
-    df["編號"] = df["檔名"].apply(lambda x: int(re.search(r'\d+', x).group()) if re.search(r'\d+', x) else None)
-    
-    # ✅ 根據「編號」欄位排序（忽略 None）
-    df = df.sort_values(by="編號", na_position='last')
 
-    # 調整欄位順序，把 "編號" 放最前面
-    columns_order = ["編號", "檔名"] + [col for col in df.columns if col not in ["檔名", "編號"]]
-    df = df[columns_order]
+def process_page_ranges_multiprocessing(pdf_path, ranges, config):
+    """不讀取分割檔，直接把清理後 PDF 的頁碼區段 [(起始, 結束), ...] 當作各份文件擷取"""
+    documents = [(f"split_{i + 1}.pdf", pdf_path, list(range(start, end + 1)))
+                 for i, (start, end) in enumerate(ranges)]
+    extract_documents_multiprocessing(documents, config)
 
-    df.to_excel(output_excel, index=False)
-    print(f"\n提取結果已保存至：{output_excel}")
 
-    # 寫入提示訊息到 F2 並儲存關閉
-    try:
-        workbook = load_workbook(output_excel)
-        sheet = workbook.active
-        sheet['F2'] = "請留一個工廠編號，完成後存檔關閉"
+def save_extraction_results(extracted_data, output_excel):
+    """將擷取結果依檔名編號排序後，以串流模式一次寫成 Excel（含 F2 提示）"""
+    # 擷取檔名中的數字編號（批次模式的檔名前有來源資料夾，例如 掃描1/split_3.pdf）
+    for data in extracted_data:
+        match = re.search(r'\d+', os.path.basename(data["檔名"]))
+        data["編號"] = int(match.group()) if match else None
+
+    # ✅ 根據來源與「編號」欄位排序（None 放最後）
+    rows = sorted(extracted_data, key=lambda data: (os.path.dirname(data["檔名"]), data["編號"] is None,
+                                                    data["編號"] or 0))
+
+    # 調整欄位順序，把 "編號" 放最前面
+    columns_order = ["編號", "檔名"]
+    for data in rows:
+        columns_order += [col for col in data if col not in columns_order]
+
+    hint_column = 5  # F 欄
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(columns_order)
+    for index, data in enumerate(rows or [{}]):
+        values = [data.get(col) for col in columns_order]
+        if index == 0:
+            # 寫入提示訊息到 F2
+            values += [None] * (hint_column + 1 - len(values))
+            values[hint_column] = "請留一個工廠編號，完成後存檔關閉"
+        sheet.append(values)
+
+    with span("workbook_save", path=output_excel, rows=len(rows)):
         workbook.save(output_excel)
-        workbook.close()
-        #print("✅ 已在 F2 寫入提示訊息")
-    except Exception as e:
-        print(f"⚠️ 無法寫入提示訊息：{e}")
+    print(f"\n提取結果已保存至：{output_excel}")
+
+
+def print_progress(done_pages, total_pages, start_time, done_docs=None, total_docs=None):
+    """在同一行更新進度：完成頁數、頁/秒、預估剩餘時間"""
+    elapsed = time.time() - start_time
+    rate = done_pages / elapsed if elapsed > 0 else 0
+    eta = (total_pages - done_pages) / rate if rate > 0 else 0
+    minutes, seconds = divmod(int(eta), 60)
+    docs = f"{done_docs}/{total_docs} 份，" if total_docs else ""
+    print(f"\r進度：{done_pages}/{total_pages} 頁，{docs}"
+          f"{rate:.2f} 頁/秒，剩餘約 {minutes:02d}:{seconds:02d}  ", end="", flush=True)
+
 
-    
 # 單核處理，除錯用
 # 定義函數：處理資料夾內的所有 PDF 並輸出到 Excel
 def process_folder(folder_path, output_excel = 'extracted_data_factory.xlsx'):      
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from preprocess import PREPROCESS_KEYS
+from factory_to_sheet_mc import view_render_dpi, ocr_render_key
+
+
+"""
+工作目錄與檢查點（單次渲染流程使用）
+
+每份 PDF 以內容雜湊建立一個工作目錄 job_dir/<雜湊>：
+  pages.jsonl    每頁完成時追加一行：空白判斷、大印比對、OCR 文字，以及當時各階段的設定指紋
+  manifest.json  分割點、分割檔、擷取結果等整批階段的完成狀態與設定指紋
+
+中斷後重新選擇同一份 PDF 會從未完成的頁面繼續；設定變更時只重算受影響的階段
+（例如只改 sift_threshold 會重新比對大印，但沿用空白判斷與 OCR 文字）。
+超過 job_retention_days 天沒有更新的工作目錄會被刪除（見 prune_job_dirs）。
+"""
+
+
+# 各階段結果受哪些設定影響
+STAGE_CONFIG_KEYS = {
+    "blank": ["blank_page_threshold", "std_threshold"] + PREPROCESS_KEYS,
+    "stamp": ["matcher", "sift_threshold", "matcher_thresholds", "stamp_search_region", "stamp_downscale",
+              "stamp_template_scales", "stamp_prefilter", "prefilter_hue_range", "prefilter_min_saturation",
+              "prefilter_ink_ratio", "stamp_prefilter_audit"]
+             + PREPROCESS_KEYS,
+    "ocr": ["dpi", "tesseract_lang", "tesseract_config", "ocr_backend", "adaptive_ocr", "ocr_low_dpi",
+            "ocr_min_confidence", "ocr_mode", "number_ocr_lang", "number_ocr_config", "number_min_digits"]
+           + PREPROCESS_KEYS,
+    "split_files": ["process_folder"],
+    "extract": ["document_number_pattern", "factory_number_pattern", "exclude_path"],
+}
+
+STAGE_NAMES = {
+    "blank": "空白頁判斷",
+    "stamp": "大印比對",
+    "ocr": "OCR",
+    "split_points": "分割點",
+    "split_files": "分割檔",
+    "extract": "擷取結果",
+}
+
+
+def file_digest(path):
+    """檔案內容的 SHA-256；檔案不存在時回傳空字串"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except OSError:
+        return ""
+    return digest.hexdigest()
+
+
+def fingerprint(*parts):
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def stage_fingerprints(config, image_paths):
+    """計算各階段目前的設定指紋；模板圖片與排除清單以檔案內容計入"""
+    values = {stage: [config.get(key) for key in keys] for stage, keys in STAGE_CONFIG_KEYS.items()}
+    # 空白判斷與大印比對的影像由 view_render_dpi 的渲染縮小而成（受 dpi、adaptive_ocr、記憶體預算模式影響）
+    view = view_render_dpi(config)
+    fingerprints = {
+        "blank": fingerprint(values["blank"], view),
+        "stamp": fingerprint(values["stamp"], view, sorted(file_digest(path) for path in image_paths)),
+        "ocr": fingerprint(values["ocr"], ocr_render_key(config)),  # 記憶體預算模式改變 OCR 影像
+        "extract": fingerprint(values["extract"], file_digest(config.get("exclude_path", "exclude_numbers.txt"))),
+    }
+    fingerprints["split_points"] = fingerprint(fingerprints["blank"], fingerprints["stamp"])
+    fingerprints["split_files"] = fingerprint(values["split_files"])  # 分割內容由 key（各文件頁碼）比對
+    return fingerprints
+
+
+def prune_job_dirs(config):
+    """刪除超過 job_retention_days 天沒有更新的工作目錄（以 manifest.json 的修改時間為準）；0 表示不刪除"""
+    retention_days = config.get("job_retention_days", 7)
+    root = config.get("job_dir", "jobs")
+    if not retention_days or retention_days <= 0 or not os.path.isdir(root):
+        return
+    oldest = time.time() - retention_days * 86400
+    removed = 0
+    for name in os.listdir(root):
+        job_dir = os.path.join(root, name)
+        if not os.path.isdir(job_dir):
+            continue
+        manifest_path = os.path.join(job_dir, "manifest.json")
+        try:
+            updated = os.path.getmtime(manifest_path if os.path.exists(manifest_path) else job_dir)
+        except OSError:
+            continue
+        if updated < oldest:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            removed += 1
+    if removed:
+        print(f"工作目錄已清除 {removed} 個超過 {retention_days} 天未使用的工作")
+
+
+class JobManifest:
+    """單一 PDF 的工作目錄：逐頁檢查點與整批階段的完成紀錄"""
+
+    def __init__(self, pdf_path, config, image_paths):
+        pdf_digest = file_digest(pdf_path)
+        self.job_dir = os.path.join(config.get("job_dir", "jobs"), pdf_digest[:16])
+        os.makedirs(self.job_dir, exist_ok=True)
+        self.manifest_path = os.path.join(self.job_dir, "manifest.json")
+        self.pages_path = os.path.join(self.job_dir, "pages.jsonl")
+        self.fingerprints = stage_fingerprints(config, image_paths)
+
+        self.manifest = self.load_manifest()
+        if self.manifest.get("pdf_digest") != pdf_digest:
+            self.manifest = {"pdf_digest": pdf_digest, "stages": {}}
+            if os.path.exists(self.pages_path):
+                os.remove(self.pages_path)
+        self.previous_fingerprints = self.manifest.get("fingerprints", {})
+        self.manifest["pdf_path"] = os.path.abspath(pdf_path)
+        self.manifest["fingerprints"] = self.fingerprints
+
+        self.pages = self.load_pages()
+        self.page_file = open(self.pages_path, "a", encoding="utf-8")
+        self.save_manifest()
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def save_manifest(self):
+        self.manifest["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def load_pages(self):
+        """讀取逐頁檢查點，同一頁以最後一行為準；寫到一半的最後一行略過"""
+        pages = {}
+        if not os.path.exists(self.pages_path):
+            return pages
+        with open(self.pages_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                pages[record["page_num"]] = record
+        return pages
+
+    def changed_stages(self):
+        """與上次執行相比設定指紋不同的階段"""
+        if not self.previous_fingerprints:
+            return []
+        return [stage for stage, value in self.fingerprints.items()
+                if self.previous_fingerprints.get(stage) not in (None, value)]
+
+    def known_page_stages(self, page_num):
+        """回傳這一頁仍然有效的階段結果：{"blank": bool, "stamp": (bool, stage), "ocr": text}"""
+        record = self.pages.get(page_num)
+        known = {}
+        if record is None:
+            return known
+        saved = record["fingerprints"]
+        if saved.get("blank") == self.fingerprints["blank"]:
+            known["blank"] = record["is_blank"]
+        if saved.get("stamp") == self.fingerprints["stamp"]:
+            known["stamp"] = (record["is_similar"], record["stamp_stage"])
+        if saved.get("ocr") == self.fingerprints["ocr"]:
+            known["ocr"] = record["text"]
+        return known
+
+    @staticmethod
+    def page_result(page_num, known):
+        """有效結果足以還原整頁分析時回傳結果 dict，否則回傳 None"""
+        if "blank" not in known:
+            return None
+        if known["blank"]:
+            return {"page_num": page_num, "is_blank": True, "is_similar": False, "stamp_stage": None, "text": ""}
+        if "stamp" not in known or "ocr" not in known:
+            return None
+        is_similar, stamp_stage = known["stamp"]
+        return {"page_num": page_num, "is_blank": False, "is_similar": is_similar,
+                "stamp_stage": stamp_stage, "text": known["ocr"]}
+
+    def record_page(self, result):
+        """每頁完成後立即追加檢查點；空白頁不需要大印與 OCR 結果"""
+        fingerprints = {"blank": self.fingerprints["blank"]}
+        if not result["is_blank"]:
+            fingerprints["stamp"] = self.fingerprints["stamp"]
+            fingerprints["ocr"] = self.fingerprints["ocr"]
+        record = dict(result, is_blank=bool(result["is_blank"]), is_similar=bool(result["is_similar"]),
+                      fingerprints=fingerprints)
+        self.pages[result["page_num"]] = record
+        self.page_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.page_file.flush()
+        os.fsync(self.page_file.fileno())
+
+    def stage_data(self, stage, key=None):
+        """整批階段已完成且設定指紋與輸入都相同時回傳當時記錄的資料，否則回傳 None"""
+        entry = self.manifest["stages"].get(stage)
+        if entry is None or entry["fingerprint"] != self.fingerprints[stage] or entry.get("key") != key:
+            return None
+        return entry.get("data", {})
+
+    def complete_stage(self, stage, key=None, data=None):
+        self.manifest["stages"][stage] = {
+            "fingerprint": self.fingerprints[stage],
+            "key": key,
+            "data": data or {},
+            "completed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        self.save_manifest()
+
+    def close(self):
+        self.page_file.close()
@@ -0,0 +1,154 @@
+import sys
+
+
+"""
+記憶體預算模式（config.json 的 memory_budget_mb 大於 0 時開啟）
+
+  OCR 影像以灰階（或黑白）直接渲染成 NumPy 陣列，大印比對另以 72 dpi 小圖進行，
+  高解析度影像只在 OCR 當下存在，每個 worker 同時最多一張；
+  單張影像超過 raster_budget_mb 時自動降低該頁 dpi；
+  處理程序數依預算自動調降：(memory_budget_mb - 主程序記憶體) / (worker_memory_mb + 影像用量)。
+
+峰值記憶體（RSS）依階段列出：Linux 讀取 /proc（每階段重設峰值），
+Windows 需安裝 psutil（無法重設，為行程啟動以來的峰值）。
+"""
+
+
+A4_POINTS = (595, 842)
+
+# pytesseract 會再轉成 PIL 影像並寫出暫存檔，單張影像以 3 倍估算
+RASTER_COPIES = 3
+
+_WORKER_NOTICE = None
+
+
+def memory_budget_enabled(config):
+    return config.get("memory_budget_mb", 0) > 0
+
+
+def raster_channels(config):
+    return 3 if config.get("budget_color_mode", "gray") == "rgb" else 1
+
+
+def raster_mb(width_pt, height_pt, dpi, channels):
+    """以 dpi 渲染 width_pt x height_pt（點）頁面所需的 MB"""
+    scale = dpi / 72
+    return width_pt * scale * height_pt * scale * channels / (1024 * 1024)
+
+
+def capped_dpi(width_pt, height_pt, dpi, channels, config):
+    """單張影像超過 raster_budget_mb 時回傳降低後的 dpi"""
+    limit = config.get("raster_budget_mb", 32)
+    size = raster_mb(width_pt, height_pt, dpi, channels)
+    if limit <= 0 or size <= limit:
+        return dpi
+    return max(72, int(dpi * (limit / size) ** 0.5))
+
+
+def read_proc_status(field):
+    """讀取 /proc/self/status 的記憶體欄位（MB），非 Linux 回傳 None"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def psutil_memory_info():
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info()
+
+
+def current_rss_mb():
+    rss = read_proc_status("VmRSS")
+    if rss is not None:
+        return rss
+    info = psutil_memory_info()
+    return info.rss / (1024 * 1024) if info is not None else None
+
+
+def peak_rss_mb():
+    peak = read_proc_status("VmHWM")
+    if peak is not None:
+        return peak
+    info = psutil_memory_info()
+    if info is not None:
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def reset_peak_rss():
+    """重設峰值（Linux 4.0 以上），成功時回傳 True"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def plan_workers(config, requested):
+    """依記憶體預算調降處理程序數（以 A4 頁面在 OCR dpi 下的影像估算）"""
+    global _WORKER_NOTICE
+    if not memory_budget_enabled(config):
+        return requested
+
+    budget = config["memory_budget_mb"]
+    channels = raster_channels(config)
+    dpi = capped_dpi(*A4_POINTS, config.get("dpi", 300), channels, config)
+    per_worker = config.get("worker_memory_mb", 250) + RASTER_COPIES * raster_mb(*A4_POINTS, dpi, channels)
+    available = budget - (current_rss_mb() or 0)
+    workers = max(1, min(requested, int(available // per_worker)))
+
+    notice = (requested, workers)
+    if notice != _WORKER_NOTICE:
+        _WORKER_NOTICE = notice
+        if workers < requested:
+            print(f"記憶體預算 {budget} MB：處理程序數由 {requested} 調降為 {workers}（每個約 {per_worker:.0f} MB）")
+        if workers * per_worker > available:
+            print(f"[警告] 記憶體預算 {budget} MB 不足以執行一個處理程序（約需 {per_worker:.0f} MB）")
+    return workers
+
+
+class MemoryReport:
+    """依階段記錄主程序與 worker 的峰值 RSS；未開啟記憶體預算模式時不做事"""
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.stages = {}
+
+    def begin(self, stage):
+        if self.enabled:
+            reset_peak_rss()
+            self.stages.setdefault(stage, {"main": None, "worker": None})
+
+    def end(self, stage):
+        if self.enabled:
+            self.record(stage, "main", peak_rss_mb())
+
+    def record(self, stage, kind, value):
+        if not self.enabled or value is None:
+            return
+        entry = self.stages.setdefault(stage, {"main": None, "worker": None})
+        entry[kind] = value if entry[kind] is None else max(entry[kind], value)
+
+    def print_report(self):
+        if not self.enabled or not self.stages:
+            return
+        print("\n峰值記憶體（MB）")
+        print(f"{'階段':<16}{'主程序':>10}{'worker 最高':>14}")
+        for stage, entry in self.stages.items():
+            main = "" if entry["main"] is None else f"{entry['main']:.0f}"
+            worker = "" if entry["worker"] is None else f"{entry['worker']:.0f}"
+            print(f"{stage:<16}{main:>10}{worker:>14}")
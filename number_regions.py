@@ -0,0 +1,121 @@
+import cv2
+import numpy as np
+
+
+"""
+找出頁面上可能是編號的數字串區域（ocr_mode 為 numbers 時使用）
+
+發文字號（10 碼）與工廠編號（8 碼或 S 加 7 碼）都是同一行上一串高度一致、寬度窄的字元：
+  1. Otsu 二值化後取連通元件，保留高度在一般字級範圍、寬度小於高度的元件（半形數字與 S）
+  2. 依水平位置把同一基線、間距小、高度相近的元件串起來
+  3. 在高度或基線與整串不一致的元件處切開（中文字的部首高低不一，數字則整齊），
+     並在字元中心距離明顯大於整串中位數處切開（兩個編號之間的空白；數字多為等寬，窄的 1 不受影響），
+     留下至少 number_min_digits 個元件的串
+  4. 辨識時只把串內的元件畫到白底影像上，相鄰的中文字不會混進來
+
+頁面解析度以長邊等於 A4 長邊（11.69 吋）估算。
+"""
+
+
+A4_LONG_EDGE_INCHES = 11.69
+
+# 字元高度範圍（吋）：約 4pt 到 25pt 字級的數字
+MIN_CHAR_INCHES = 0.06
+MAX_CHAR_INCHES = 0.35
+
+
+def to_gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+
+
+def digit_components(gray):
+    """回傳像半形數字的連通元件 (x, y, w, h)，依 x 排序"""
+    pixels_per_inch = max(gray.shape) / A4_LONG_EDGE_INCHES
+    min_height = MIN_CHAR_INCHES * pixels_per_inch
+    max_height = MAX_CHAR_INCHES * pixels_per_inch
+
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    stats = stats[1:]  # 第 0 個是背景
+    w, h = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]
+    keep = (h >= min_height) & (h <= max_height) & (w >= 0.1 * h) & (w <= 0.9 * h)
+    boxes = stats[keep][:, :4]
+    return boxes[np.argsort(boxes[:, 0], kind="stable")]
+
+
+def group_runs(boxes):
+    """把同一基線、間距不超過一個字高、高度相近的元件串成一串（boxes 依 x 排序）"""
+    runs = []
+    active = []  # 還能往右接的串
+    for box in boxes:
+        x, y, w, h = (int(value) for value in box)
+        active = [run for run in active if x - (run[-1][0] + run[-1][2]) <= run[-1][3]]
+        for run in active:
+            last_x, last_y, last_w, last_h = run[-1]
+            gap = x - (last_x + last_w)
+            same_line = abs((y + h / 2) - (last_y + last_h / 2)) < 0.3 * last_h
+            if -0.1 * last_h <= gap <= last_h and same_line and 0.75 <= h / last_h <= 1.33:
+                run.append((x, y, w, h))
+                break
+        else:
+            runs.append([(x, y, w, h)])
+            active.append(runs[-1])
+    return runs
+
+
+# 字元中心距離超過整串中位數的倍數時視為編號之間的空白
+WORD_PITCH_RATIO = 1.3
+
+
+def split_run(run):
+    """
+    在高度與中位數相差超過 12%，或中心偏離整串基線（以直線擬合，容許些微歪斜）超過 12% 字高的元件處切開；
+    與前一個元件的中心距離超過整串中位數 WORD_PITCH_RATIO 倍（中間有空白）時也切開
+    """
+    if len(run) < 2:
+        return [run]
+    heights = np.array([h for _, _, _, h in run], dtype=float)
+    centers_x = np.array([x + w / 2 for x, _, w, _ in run], dtype=float)
+    centers_y = np.array([y + h / 2 for _, y, _, h in run], dtype=float)
+    median = float(np.median(heights))
+    slope, intercept = np.polyfit(centers_x, centers_y, 1)
+    fits = (np.abs(heights - median) <= 0.12 * median) & \
+           (np.abs(centers_y - (slope * centers_x + intercept)) <= 0.12 * median)
+    pitches = np.diff(centers_x)
+    breaks = np.concatenate(([False], pitches > WORD_PITCH_RATIO * np.median(pitches)))
+
+    segments, current = [], []
+    for box, fit, new_word in zip(run, fits, breaks):
+        if current and (not fit or new_word):
+            segments.append(current)
+            current = []
+        if fit:
+            current.append(box)
+    if current:
+        segments.append(current)
+    return segments
+
+
+def find_number_runs(image, min_digits=6):
+    """
+    找出可能是編號的字元串。
+
+    Returns:
+        List[List[(x, y, w, h)]]: 由上而下、由左而右排序，每串為各字元的外框
+    """
+    gray = to_gray(image)
+    runs = [segment for run in group_runs(digit_components(gray)) if len(run) >= min_digits
+            for segment in split_run(run) if len(segment) >= min_digits]
+    return sorted(runs, key=lambda run: (run[0][1], run[0][0]))
+
+
+def run_crop(gray, run, border=10):
+    """只把串內各字元畫到白底影像上（外加 border 像素白邊），供單行 OCR"""
+    x0 = min(x for x, _, _, _ in run)
+    y0 = min(y for _, y, _, _ in run)
+    x1 = max(x + w for x, _, w, _ in run)
+    y1 = max(y + h for _, y, _, h in run)
+    crop = np.full((y1 - y0 + 2 * border, x1 - x0 + 2 * border), 255, dtype=np.uint8)
+    for x, y, w, h in run:
+        crop[y - y0 + border:y - y0 + border + h, x - x0 + border:x - x0 + border + w] = gray[y:y + h, x:x + w]
+    return crop
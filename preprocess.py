@@ -0,0 +1,125 @@
+import cv2
+import numpy as np
+
+from number_regions import A4_LONG_EDGE_INCHES, to_gray
+
+
+"""
+掃描頁前處理（config.json 的 preprocess 開啟時使用），全部以 OpenCV／NumPy 整張陣列運算
+
+  1. 裁掉掃描器的黑邊（preprocess_crop_border）：由四邊往內，墨水比例超過 border_ink_ratio 的列／欄
+  2. 估計歪斜角度並轉正（preprocess_deskew）：在 ±deskew_max_angle 度內找水平投影最集中的角度
+  3. 自適應二值化（preprocess_binarize）：binarize_block_size、binarize_c
+  4. 去除雜點（preprocess_despeckle）：面積小於 despeckle_max_area（以 300 dpi 計）的墨點
+
+回傳轉正、裁邊後的原影像（大印比對、空白判斷使用）與二值化影像（OCR 使用），每頁只做一次。
+頁面解析度以長邊等於 A4 長邊（11.69 吋）估算。
+"""
+
+
+# 會影響前處理結果的設定
+PREPROCESS_KEYS = ["preprocess", "preprocess_crop_border", "border_ink_ratio", "preprocess_deskew", "deskew_max_angle",
+                   "preprocess_binarize", "binarize_block_size", "binarize_c", "preprocess_despeckle",
+                   "despeckle_max_area"]
+
+# 估計歪斜角度時縮小到的長邊像素
+SKEW_ESTIMATE_SIZE = 1000
+
+
+def preprocess_enabled(config):
+    return config.get("preprocess", False)
+
+
+def find_border_box(gray, ink_ratio=0.6):
+    """由四邊往內略過墨水比例超過 ink_ratio 的列／欄（掃描黑邊），回傳內容範圍 (x0, y0, x1, y1)"""
+    ink = gray < 128
+    row_ratio = ink.mean(axis=1)
+    col_ratio = ink.mean(axis=0)
+
+    def inner_range(ratio):
+        content = np.flatnonzero(ratio <= ink_ratio)
+        if content.size == 0:
+            return 0, ratio.size
+        return int(content[0]), int(content[-1]) + 1
+
+    y0, y1 = inner_range(row_ratio)
+    x0, x1 = inner_range(col_ratio)
+    return x0, y0, x1, y1
+
+
+def skew_scores(ys, xs, angles):
+    """各角度下墨水點水平投影的集中程度（各列點數平方和），一次以 bincount 計算"""
+    radians = np.deg2rad(angles)
+    projected = np.outer(ys, np.cos(radians)) + np.outer(xs, np.sin(radians))
+    rows = np.round(projected - projected.min(axis=0)).astype(np.int64)
+    height = int(rows.max()) + 1
+    flat = rows + np.arange(len(angles)) * height
+    counts = np.bincount(flat.ravel(), minlength=len(angles) * height).reshape(len(angles), height)
+    return (counts.astype(np.float64) ** 2).sum(axis=1)
+
+
+def estimate_skew(gray, max_angle=5.0):
+    """估計文字行的歪斜角度（度，正值為逆時針，轉正時旋轉負值），先以 0.5 度粗找再以 0.05 度細找"""
+    scale = min(1.0, SKEW_ESTIMATE_SIZE / max(gray.shape))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    ys, xs = np.nonzero(small < 128)
+    if ys.size < 100:
+        return 0.0
+    if ys.size > 40000:
+        step = ys.size // 40000 + 1
+        ys, xs = ys[::step], xs[::step]
+
+    coarse = np.arange(-max_angle, max_angle + 0.25, 0.5)
+    best = coarse[int(np.argmax(skew_scores(ys, xs, coarse)))]
+    fine = np.arange(best - 0.5, best + 0.525, 0.05)
+    return float(fine[int(np.argmax(skew_scores(ys, xs, fine)))])
+
+
+def rotate_image(image, angle):
+    """以頁面中心旋轉 angle 度，空出的部分補白"""
+    height, width = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    border = (255,) * (image.shape[2] if image.ndim == 3 else 1)
+    return cv2.warpAffine(image, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=border)
+
+
+def despeckle(binary, max_area):
+    """去掉面積不超過 max_area 像素的墨點（binary 為白底黑字）"""
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(255 - binary, connectivity=8)
+    small = stats[:, cv2.CC_STAT_AREA] <= max_area
+    small[0] = False  # 背景
+    binary[small[labels]] = 255
+    return binary
+
+
+def preprocess_image(image, config):
+    """
+    前處理一頁影像。
+
+    Returns:
+        (clean, ocr_image): 轉正、裁邊後的原影像（保留色彩），以及 OCR 用的影像
+                            （開啟 preprocess_binarize 時為二值化結果，否則為灰階）
+    """
+    gray = to_gray(image)
+    pixels_per_inch = max(gray.shape) / A4_LONG_EDGE_INCHES
+
+    if config.get("preprocess_crop_border", True):
+        x0, y0, x1, y1 = find_border_box(gray, config.get("border_ink_ratio", 0.6))
+        image, gray = image[y0:y1, x0:x1], gray[y0:y1, x0:x1]
+
+    if config.get("preprocess_deskew", True):
+        angle = estimate_skew(gray, config.get("deskew_max_angle", 5))
+        if abs(angle) >= 0.1:
+            image = rotate_image(image, -angle)
+            gray = to_gray(image)
+
+    ocr_image = gray
+    if config.get("preprocess_binarize", True):
+        block_size = int(config.get("binarize_block_size", 31) * pixels_per_inch / 300) | 1
+        ocr_image = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                          max(3, block_size), config.get("binarize_c", 15))
+        if config.get("preprocess_despeckle", True):
+            max_area = config.get("despeckle_max_area", 8) * (pixels_per_inch / 300) ** 2
+            ocr_image = despeckle(ocr_image, max_area)
+    return np.ascontiguousarray(image), ocr_image
@@ -0,0 +1,225 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+
+"""
+工廠登記查詢網站的本機替身，用來測試 factory_query 而不連到正式網站
+
+框架結構與正式網站相同：index.jsp 內有 search（輸入 regiID）與 show（查詢結果）兩個框架，
+結果頁的連結以 _top 開啟工廠詳細資料，各欄位的位置與 perform_web_search 讀取的 XPath 一致。
+
+  python registry_mock_server.py --port 8765 --delay 0.3 --fail-rate 0.1
+  python registry_mock_server.py --pages 錄製頁面資料夾   優先回傳錄下的 list_<編號>.html、factInfo_<編號>.html
+  config.json 的 registry_url 改為 http://127.0.0.1:8765/Fidbweb/index.jsp
+"""
+
+
+INDEX_PAGE = """<html><head><meta charset="utf-8"><title>工廠登記公示資料查詢</title></head>
+<frameset rows="120,*">
+<frame name="search" src="search.jsp">
+<frame name="show" src="blank.html">
+</frameset></html>"""
+
+SEARCH_PAGE = """<html><head><meta charset="utf-8">
+<script>
+function checkID() {
+  var v = document.forms[0].regiID.value;
+  if (!/^(\d{8}|S\d{7})$/.test(v)) { alert('工廠登記編號格式錯誤'); return false; }
+  return true;
+}
+</script></head>
+<body><form method="post" action="list.jsp" target="show" onsubmit="return checkID()">
+工廠登記編號 <input type="text" name="regiID"> <input type="submit" value="查詢">
+</form></body></html>"""
+
+LIST_PAGE = """<html><head><meta charset="utf-8"></head><body><form>
+<table><tbody><tr><td>
+<table><tbody><tr><td>查詢條件：{regi_id}</td></tr></tbody></table>
+<table><tbody>
+<tr><th>序號</th><th><font><h2>工廠名稱</h2></font></th></tr>
+{rows}
+</tbody></table>
+</td></tr></tbody></table>
+</form></body></html>"""
+
+LIST_ROW = """<tr><td>1</td><td><h3><a href="factInfo.jsp?regiID={regi_id}" target="_top">{name}</a></h3></td></tr>"""
+
+DETAIL_PAGE = """<html><head><meta charset="utf-8"></head><body><form>
+<div><div>工廠登記公示資料</div><div><div>
+<div>基本資料</div><div></div>
+<div><h2 id="factInfoMain"><b><font>{name}</font></b></h2></div>
+</div></div></div>
+<table id="AutoNumber4"><tbody>
+<tr><td><font>{regi_id}</font></td><td><font>工廠登記編號</font></td></tr>
+<tr><td><font>{address}</font></td></tr>
+<tr><td><font>{location}</font></td><td><font>{district}</font></td></tr>
+<tr><td><font>{owner}</font></td></tr>
+<tr><td><font>{category}</font></td></tr>
+<tr><td><font>{registered}</font></td></tr>
+<tr><td><font>{status}</font></td></tr>
+</tbody></table>
+</form></body></html>"""
+
+ERROR_PAGE = """<html><head><meta charset="utf-8"></head><body>系統忙碌中，請稍後再試</body></html>"""
+
+LOCATIONS = ["臺北市", "新北市", "桃園市", "臺中市", "臺南市", "高雄市"]
+STATUSES = ["生產中", "歇業", "停工"]
+
+
+def synthetic_record(regi_id):
+    """依編號產生固定的假資料"""
+    rng = random.Random(regi_id)
+    location = rng.choice(LOCATIONS)
+    return {
+        "regi_id": regi_id,
+        "name": f"測試工業股份有限公司{regi_id[-4:]}廠",
+        "address": f"{location}測試區工業路{rng.randint(1, 999)}號",
+        "location": location,
+        "district": "測試區",
+        "owner": "王大明",
+        "category": "金屬製品製造業",
+        "registered": "0990101",
+        "status": rng.choice(STATUSES),
+    }
+
+
+class RegistryState:
+    """替身網站的資料與故障設定，所有請求共用"""
+
+    def __init__(self, records=None, delay=0.0, fail_rate=0.0, pages_dir=None, seed=0):
+        self.records = records or {}
+        self.pages_dir = pages_dir
+        self.delay = delay
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.hits = {}
+
+    def lookup(self, regi_id):
+        """自訂資料優先（缺少的欄位以假資料補齊）；其餘結尾為 0 的編號視為查無資料"""
+        if regi_id in self.records:
+            record = synthetic_record(regi_id)
+            record.update(self.records[regi_id])
+            record["regi_id"] = regi_id
+            return record
+        if not regi_id or regi_id.endswith("0"):
+            return None
+        return synthetic_record(regi_id)
+
+    def recorded_page(self, path, regi_id):
+        """錄製頁面：<pages_dir>/<頁面名稱>_<編號>.html，例如 list_12345678.html"""
+        if not self.pages_dir:
+            return None
+        page_path = os.path.join(self.pages_dir, f"{os.path.splitext(path)[0]}_{regi_id}.html")
+        if not os.path.exists(page_path):
+            return None
+        with open(page_path, "rb") as f:
+            return f.read()
+
+    def should_fail(self):
+        with self.lock:
+            return self.rng.random() < self.fail_rate
+
+    def count(self, path):
+        with self.lock:
+            self.hits[path] = self.hits.get(path, 0) + 1
+
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_html(self, body, status=200):
+        data = body if isinstance(body, bytes) else body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html" if isinstance(body, bytes) else "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_page(self, params):
+        path = urlparse(self.path).path.rsplit("/", 1)[-1]
+        self.state.count(path)
+        regi_id = params.get("regiID", [""])[0].strip()
+
+        if path in ("", "index.jsp"):
+            return self.send_html(INDEX_PAGE)
+        if path == "search.jsp":
+            return self.send_html(SEARCH_PAGE)
+        if path == "blank.html":
+            return self.send_html("<html><body></body></html>")
+
+        if self.state.delay:
+            time.sleep(self.state.delay)
+
+        recorded = self.state.recorded_page(path, regi_id)
+        if recorded is not None:
+            return self.send_html(recorded)
+        if path == "list.jsp":
+            if self.state.should_fail():
+                return self.send_html(ERROR_PAGE)  # 正式網站忙碌時仍回應 200
+            record = self.state.lookup(regi_id)
+            rows = LIST_ROW.format(**record) if record else ""
+            return self.send_html(LIST_PAGE.format(regi_id=regi_id, rows=rows))
+        if path == "factInfo.jsp":
+            record = self.state.lookup(regi_id)
+            if record is None or self.state.should_fail():
+                return self.send_html(ERROR_PAGE, 503)
+            return self.send_html(DETAIL_PAGE.format(**record))
+        self.send_html(ERROR_PAGE, 404)
+
+    def do_GET(self):
+        self.handle_page(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8")
+        params = parse_qs(urlparse(self.path).query)
+        params.update(parse_qs(body))
+        self.handle_page(params)
+
+
+def make_server(port=0, records=None, delay=0.0, fail_rate=0.0, pages_dir=None):
+    """建立替身網站（port=0 自動選擇），回傳 (server, 查詢網址)"""
+    state = RegistryState(records, delay, fail_rate, pages_dir)
+    handler = type("Handler", (RegistryHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    url = f"http://127.0.0.1:{server.server_address[1]}/Fidbweb/index.jsp"
+    return server, url
+
+
+def start_server(**kwargs):
+    """在背景執行緒啟動替身網站，回傳 (server, 查詢網址)；結束時呼叫 server.shutdown()"""
+    server, url = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="工廠登記查詢網站的本機替身")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="每筆查詢的模擬延遲（秒）")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="結果頁回傳忙碌頁面、詳細資料頁回傳錯誤的機率")
+    parser.add_argument("--pages", help="錄製頁面資料夾")
+    parser.add_argument("--data", help="自訂資料 JSON：{編號: {name, address, location, status, ...}}")
+    args = parser.parse_args()
+
+    records = None
+    if args.data:
+        with open(args.data, "r", encoding="utf-8") as f:
+            records = json.load(f)
+
+    server, url = make_server(args.port, records, args.delay, args.fail_rate, args.pages)
+    print(f"替身網站已啟動：{url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
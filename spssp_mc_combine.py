@@ -5,16 +5,27 @@ import os
 import sys
 import shutil
 import json
+import hashlib
 import pytesseract
 import time
+import argparse
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import filedialog
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from collections import Counter
 import multiprocessing
 
-from factory_to_sheet_mc import process_folder_multiprocessing
+from factory_to_sheet_mc import process_folder_multiprocessing, process_page_ranges_multiprocessing
+from factory_to_sheet_mc import render_page_array, render_ocr_image, ensure_tesseract_path
+from factory_to_sheet_mc import first_ocr_dpi, view_render_dpi, ocr_adaptive, print_ocr_escalation, prepare_ocr_image
+from factory_to_sheet_mc import extract_text_data, join_page_texts, save_extraction_results, print_progress
+from factory_to_sheet_mc import ocr_cache_key, ocr_cache_get, ocr_cache_put, prune_ocr_cache
 from factory_query import process_excel_data
+from job_manifest import JobManifest, STAGE_NAMES, fingerprint, prune_job_dirs
+from tracing import span, start_trace, export_trace
+from memory_budget import memory_budget_enabled, plan_workers, reset_peak_rss, peak_rss_mb, MemoryReport
+from preprocess import preprocess_enabled, preprocess_image
 """
 這段程式碼會讀取1個PDF
 並依指定的特徵分割成不同檔案
@@ -82,48 +93,79 @@ def is_blank_page_v2(page, white_threshold=0.85, std_threshold=5):
     """綜合判斷是否為空白頁：文字、白色比例、像素變異"""
     text = page.get_text("text").strip()
     if text:
-        return False, 0.0, 999  # 有文字直接視為有內容
+        return False  # 有文字直接視為有內容
 
     pix = page.get_pixmap()
     img = np.frombuffer(pix.samples, dtype=np.uint8)
-    white_pixels = np.sum(img == 255)
-    total_pixels = pix.width * pix.height * pix.n
-    ratio = white_pixels / total_pixels
+    return is_blank_image(img, white_threshold, std_threshold)
 
+
+def is_blank_image(img, white_threshold=0.85, std_threshold=5):
+    """以白色比例與像素變異判斷影像是否為空白"""
+    ratio = np.count_nonzero(img == 255) / img.size
     std_dev = np.std(img)
 
     # 綜合判斷
     is_blank = (ratio >= white_threshold) and (std_dev <= std_threshold)
-    #print(f"[DEBUG] Page {page.number + 1}: white ratio={ratio:.3f}, std={std_dev:.2f}, text={bool(text)}")
+    #print(f"[DEBUG] white ratio={ratio:.3f}, std={std_dev:.2f}")
     return is_blank
 
+def get_max_processes(config):
+    max_processes = config.get("max_processes")
+    if max_processes is None:
+        max_processes = max(1, multiprocessing.cpu_count() - 1)
+    return plan_workers(config, max_processes)
+
+
+def find_blank_pages(pdf_path, page_nums, config):
+    """以低解析度渲染檢查一批頁面，回傳空白頁碼（從 0 開始）；與原本相同，以 RGB 各通道的樣本統計"""
+    dpi = config.get("blank_dpi", 72)
+    blank_pages = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in page_nums:
+            page = doc[page_num]
+            if page.get_text("text").strip():
+                continue  # 有文字直接視為有內容
+            img = render_page_array(page, dpi=dpi)
+            with span("blank_check", page=page_num):
+                is_blank = is_blank_image(img, config["blank_page_threshold"], config["std_threshold"])
+            if is_blank:
+                blank_pages.append(page_num)
+    return blank_pages
+
+
 def remove_blank_pages(pdf_path, config):
-    """移除空白頁"""
+    """移除空白頁（多核心分批判斷，保留頁面一次複製），回傳移除的頁碼（從 1 開始）"""
     print(str_line('1.移除空白頁面'))
-    doc = fitz.open(pdf_path)
-    new_doc = fitz.open()
-
-    removed_pages = []  # 記錄被移除的頁碼
-    total_pages = len(doc)  # 原始總頁數
-    '''
-    for page in doc:  
-        if is_blank_page(page, threshold = config["blank_page_threshold"]):  
-            removed_pages.append(page.number + 1)  # PyMuPDF 頁碼從 0 開始，+1 轉為人類可讀的頁碼
-        else:
-            new_doc.insert_pdf(doc, from_page=page.number, to_page=page.number)
-    '''
-    for page in doc:  
-        if is_blank_page_v2(page, white_threshold = config["blank_page_threshold"],std_threshold=config["std_threshold"]):  
-            removed_pages.append(page.number + 1)  # PyMuPDF 頁碼從 0 開始，+1 轉為人類可讀的頁碼
-        else:
-            new_doc.insert_pdf(doc, from_page=page.number, to_page=page.number)
+    max_processes = get_max_processes(config)
 
-    temp_path = config["cleaned_pdf"]
-    new_doc.save(temp_path)
-    new_doc.close()
-    doc.close()
+    with fitz.open(pdf_path) as doc:
+        total_pages = doc.page_count  # 原始總頁數
 
-    # 顯示移除頁面資訊
+    # 每個 worker 分到數批頁面，避免每頁都重新開檔
+    batch_size = max(1, -(-total_pages // (max_processes * 4)))
+    batches = [list(range(start, min(start + batch_size, total_pages)))
+               for start in range(0, total_pages, batch_size)]
+
+    with span("blank_removal", pages=total_pages):
+        with ProcessPoolExecutor(max_workers=max_processes) as executor:
+            futures = [executor.submit(find_blank_pages, pdf_path, batch, config) for batch in batches]
+            blank_pages = set()
+            for future in futures:
+                blank_pages.update(future.result())
+
+        removed_pages = sorted(page_num + 1 for page_num in blank_pages)  # +1 轉為人類可讀的頁碼
+
+        with fitz.open(pdf_path) as doc:
+            doc.select([page_num for page_num in range(total_pages) if page_num not in blank_pages])
+            doc.save(config["cleaned_pdf"], garbage=3, deflate=True)  # 一併清掉被移除頁面留下的物件
+
+    print_removed_pages(removed_pages, total_pages)
+    return removed_pages
+
+
+def print_removed_pages(removed_pages, total_pages):
+    """顯示移除頁面資訊"""
     remaining_pages = total_pages - len(removed_pages)
     print("移除空白頁面:")
     for i in range(0, len(removed_pages), 5):
@@ -133,6 +175,73 @@ def remove_blank_pages(pdf_path, config):
 
 
 
+# 每個 worker 行程各自持有的模板描述子與特徵物件（由 init_stamp_worker 載入）
+_TEMPLATE_FEATURES = None
+_DETECTORS = {}
+_MATCHERS = {}
+
+# 比對方式：名稱 -> 特徵點演算法
+# bf: SIFT + 暴力比對（原本的作法）
+# flann: SIFT + FLANN KD-tree
+# orb / akaze: 二進位描述子 + FLANN LSH（Hamming）
+MATCHER_DETECTORS = {
+    "bf": "sift",
+    "flann": "sift",
+    "orb": "orb",
+    "akaze": "akaze",
+}
+
+
+def get_detector(name="sift"):
+    if name not in _DETECTORS:
+        if name == "sift":
+            _DETECTORS[name] = cv2.SIFT_create()
+        elif name == "orb":
+            _DETECTORS[name] = cv2.ORB_create(nfeatures=2000)
+        elif name == "akaze":
+            if not hasattr(cv2, "AKAZE_create"):
+                raise ValueError("此版本 OpenCV 不含 AKAZE，請改用其他比對方式")
+            _DETECTORS[name] = cv2.AKAZE_create()
+        else:
+            raise ValueError(f"不支援的特徵點演算法：{name}")
+    return _DETECTORS[name]
+
+
+def get_sift():
+    return get_detector("sift")
+
+
+def get_matcher(name="bf"):
+    if name not in _MATCHERS:
+        if name == "bf":
+            _MATCHERS[name] = cv2.BFMatcher()
+        elif name == "flann":
+            _MATCHERS[name] = cv2.FlannBasedMatcher(dict(algorithm=1, trees=5), dict(checks=50))
+        elif name in ("orb", "akaze"):
+            lsh_params = dict(algorithm=6, table_number=6, key_size=12, multi_probe_level=1)
+            _MATCHERS[name] = cv2.FlannBasedMatcher(lsh_params, dict(checks=50))
+        else:
+            raise ValueError(f"不支援的比對方式：{name}（可用：{', '.join(MATCHER_DETECTORS)}）")
+    return _MATCHERS[name]
+
+
+def get_match_threshold(config):
+    """目前比對方式的門檻；未在 matcher_thresholds 設定時沿用 sift_threshold"""
+    matcher = config.get("matcher", "bf")
+    return config.get("matcher_thresholds", {}).get(matcher, config["sift_threshold"])
+
+
+def count_good_matches(des1, des2, ratio=0.75, matcher="bf"):
+    """以 kNN 比對兩組描述子，回傳通過比例測試的配對數"""
+    matches = get_matcher(matcher).knnMatch(des1, des2, k=2)
+
+    good_matches = 0
+    for pair in matches:
+        if len(pair) == 2 and pair[0].distance < ratio * pair[1].distance:
+            good_matches += 1
+    return good_matches
+
+
 def compare_images_sift(img1, img2, threshold=10):
     """
     使用 SIFT 特徵點比對兩張圖片是否相似。
@@ -152,58 +261,226 @@ def compare_images_sift(img1, img2, threshold=10):
     if len(img2.shape) == 3:
         img2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
 
-    sift = cv2.SIFT_create()
+    sift = get_sift()
     kp1, des1 = sift.detectAndCompute(img1, None)
     kp2, des2 = sift.detectAndCompute(img2, None)
 
     if des1 is None or des2 is None:  # 檢查是否有檢測到特徵點
         return False
 
-    bf = cv2.BFMatcher()
-    matches = bf.knnMatch(des1, des2, k=2)
+    return count_good_matches(des1, des2) > threshold  # 直接返回比較結果
 
-    good_matches = []
-    for m, n in matches:
-        if m.distance < 0.75 * n.distance:
-            good_matches.append(m)
 
-    return len(good_matches) > threshold  # 直接返回比較結果
+def load_template_features(image_paths, config):
+    """
+    取得模板圖片在各比對尺度下的 SIFT 描述子。
 
+    描述子以圖片內容的 SHA-256 與尺度為鍵存放在 template_cache_dir，
+    只有新增或修改過的模板才會重新計算。
 
-def compare_image_with_pdf_page(image_paths, pdf_path, page_num, threshold=10):
-    """比較多張圖片與單一 PDF 頁面是否相似（回傳 bool）"""
-    imgs = []
+    Returns:
+        List[(image_path, scale, descriptors)]
+    """
+    cache_dir = config.get("template_cache_dir", "template_cache")
+    detector_name = MATCHER_DETECTORS[config.get("matcher", "bf")]
+    scales = config.get("stamp_template_scales", [1.0])
+    os.makedirs(cache_dir, exist_ok=True)
+
+    features = []
     for image_path in image_paths:
-        img = cv2.imread(image_path)
-        if img is None:
-            print(f"Error: Could not read image at {image_path}")
-            return page_num, False
-        imgs.append(img)
-
-    doc = fitz.open(pdf_path)
-    page = doc[page_num]
-    pix = page.get_pixmap()
-    img2 = cv2.imdecode(np.frombuffer(pix.tobytes(), np.uint8), cv2.IMREAD_COLOR)
-    doc.close()
+        try:
+            with open(image_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            data = b""
+
+        digest = hashlib.sha256(data).hexdigest()
+        img = None
+        for scale in scales:
+            cache_path = os.path.join(cache_dir, f"{digest}_{detector_name}_{scale:g}.npy")
+            if os.path.exists(cache_path):
+                features.append((image_path, scale, np.load(cache_path)))
+                continue
+
+            if img is None:
+                img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) if data else None
+                if img is None:
+                    print(f"Error: Could not read image at {image_path}")
+                    break
+                img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+            scaled = img if scale == 1 else cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            _, des = get_detector(detector_name).detectAndCompute(scaled, None)
+            if des is None:
+                print(f"[警告] 模板在尺度 {scale:g} 沒有特徵點，略過：{image_path}")
+                continue
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, des)
+            os.replace(tmp_path, cache_path)
+            features.append((image_path, scale, des))
+    return features
+
+
+def init_stamp_worker(template_features):
+    """ProcessPoolExecutor 的 initializer：每個 worker 啟動時載入一次模板描述子"""
+    global _TEMPLATE_FEATURES
+    _TEMPLATE_FEATURES = template_features
+
+
+def get_template_features(image_paths, config):
+    """取得目前行程的模板描述子，未經 initializer 載入時才讀取快取"""
+    global _TEMPLATE_FEATURES
+    if _TEMPLATE_FEATURES is None:
+        _TEMPLATE_FEATURES = load_template_features(image_paths, config)
+    return _TEMPLATE_FEATURES
+
+
+def crop_search_region(page_img, config):
+    """依 stamp_search_region（頁面比例框 [x0, y0, x1, y1]，預設整頁）裁切"""
+    x0, y0, x1, y1 = config.get("stamp_search_region", [0.0, 0.0, 1.0, 1.0])
+    height, width = page_img.shape[:2]
+    return page_img[int(height * y0):int(round(height * y1)), int(width * x0):int(round(width * x1))]
+
+
+def prepare_stamp_view(page_img, config):
+    """
+    取出大印搜尋區域並依設定縮小，減少 SIFT 需處理的像素。
 
-    for img1 in imgs:
-        if compare_images_sift(img1, img2, threshold):
-            return page_num, True
+    page_img 為 render_page_array 產生的 RGB 或灰階影像；
+    stamp_downscale 小於 1 時再縮小搜尋區域。
+    """
+    if len(page_img.shape) == 3:
+        page_img = cv2.cvtColor(page_img, cv2.COLOR_RGB2GRAY)
+
+    view = crop_search_region(page_img, config)
 
-    return page_num, False
+    downscale = config.get("stamp_downscale", 1.0)
+    if downscale < 1 and view.size:
+        view = cv2.resize(view, None, fx=downscale, fy=downscale, interpolation=cv2.INTER_AREA)
+    return view
 
 
+def best_match_count(page_img, template_features, matcher="bf", stop_above=None):
+    """
+    頁面特徵只計算一次，與各模板、各尺度的描述子比對，回傳最多的配對數。
+
+    指定 stop_above 時，配對數一超過該值就回傳，不再比對其餘模板與尺度。
+    """
+    if len(page_img.shape) == 3:
+        page_img = cv2.cvtColor(page_img, cv2.COLOR_BGR2GRAY)
+    if not page_img.size:
+        return 0
 
+    _, page_des = get_detector(MATCHER_DETECTORS[matcher]).detectAndCompute(page_img, None)
+    if page_des is None or len(page_des) < 2:
+        return 0
 
-def compare_image_with_pdf_pages_multiprocessing(image_paths, config):
-    """使用多核心比較多張圖片與 PDF 每一頁是否相似（回傳符合頁碼）"""
+    best = 0
+    for _, _, template_des in template_features:
+        best = max(best, count_good_matches(template_des, page_des, matcher=matcher))
+        if stop_above is not None and best > stop_above:
+            break
+    return best
+
+
+def compare_page_with_templates(page_img, template_features, threshold=10, matcher="bf"):
+    return best_match_count(page_img, template_features, matcher, stop_above=threshold) > threshold
+
+
+def page_is_color_scan(page):
+    """
+    頁面是否為彩色掃描：看內嵌影像實際的色彩分量數（extract_image 的 colorspace，不需解碼），
+    3 個以上即為彩色。灰階 JPEG 常標示為 ICCBased，不能只看色彩空間名稱；
+    沒有內嵌影像或讀不到時視為灰階（照常送 SIFT）。
+    """
+    for image in page.get_images(full=True):
+        try:
+            if page.parent.extract_image(image[0])["colorspace"] >= 3:
+                return True
+        except Exception:
+            continue
+    return False
+
+
+def stamp_prefilter(page_rgb, is_color, config):
+    """
+    SIFT 前的便宜預篩：彩色掃描頁檢查搜尋區域內是否有印泥顏色的像素。
+
+    Returns:
+        "rejected"：彩色掃描但沒有印泥顏色，不需跑 SIFT
+        "ink"：有印泥顏色，送 SIFT
+        "gray"：灰階掃描無法判斷，送 SIFT
+        "off"：未啟用預篩
+    """
+    if config.get("stamp_prefilter", "ink") != "ink" or page_rgb.ndim != 3:
+        return "off"
+    if not is_color:
+        return "gray"
+
+    region = crop_search_region(page_rgb, config)[::2, ::2]  # 縮圖即可判斷
+    if not region.size:
+        return "rejected"
+    hsv = cv2.cvtColor(region, cv2.COLOR_RGB2HSV)
+
+    hue_low, hue_high = config.get("prefilter_hue_range", [90, 140])
+    lower = np.array([hue_low, config.get("prefilter_min_saturation", 60), 0], dtype=np.uint8)
+    upper = np.array([hue_high, 255, 255], dtype=np.uint8)
+    ink_ratio = np.count_nonzero(cv2.inRange(hsv, lower, upper)) / (region.shape[0] * region.shape[1])
+
+    return "ink" if ink_ratio >= config.get("prefilter_ink_ratio", 0.002) else "rejected"
+
+
+def detect_stamp(page_rgb, is_color, template_features, config):
+    """
+    預篩與 SIFT 串接，回傳 (is_similar, stage)。
+
+    stamp_prefilter_audit 開啟時，被預篩排除的頁面仍會跑 SIFT，
+    若 SIFT 判定相似則標記為 "missed"，用來確認預篩門檻沒有漏掉大印。
+    """
+    stage = stamp_prefilter(page_rgb, is_color, config)
+    audit = config.get("stamp_prefilter_audit", False)
+    if stage == "rejected" and not audit:
+        return False, stage
+
+    view = prepare_stamp_view(page_rgb, config)
+    is_similar = compare_page_with_templates(view, template_features, get_match_threshold(config),
+                                             config.get("matcher", "bf"))
+    if stage == "rejected" and is_similar:
+        stage = "missed"
+    return is_similar, stage
+
+
+def print_stamp_stats(stages):
+    """顯示大印比對各階段的頁數，用來調整預篩門檻"""
+    counts = Counter(stages)
+    sent_to_sift = len(stages) - counts["rejected"]
+    print(f"大印預篩：共 {len(stages)} 頁，預篩排除 {counts['rejected']} 頁，送 SIFT {sent_to_sift} 頁"
+          f"（灰階無法預篩 {counts['gray']} 頁）")
+    if counts["missed"]:
+        print(f"[警告] 預篩排除但 SIFT 判定相似 {counts['missed']} 頁，請放寬 prefilter 門檻")
+
+
+def compare_image_with_pdf_page(image_paths, pdf_path, page_num, config):
+    """比較多張圖片與單一 PDF 頁面是否相似（回傳 page_num, is_similar, stage）"""
+    template_features = get_template_features(image_paths, config)
+
+    with fitz.open(pdf_path) as doc:
+        page = doc[page_num]
+        is_color = page_is_color_scan(page)
+        img2 = render_page_array(page)
+
+    with span("stamp_match", page=page_num):
+        is_similar, stage = detect_stamp(img2, is_color, template_features, config)
+    return page_num, is_similar, stage
+
+
+def compare_image_with_pdf_pages_multiprocessing(image_paths, config, stats=None):
+    """使用多核心比較多張圖片與 PDF 每一頁是否相似（回傳符合頁碼）；stats 為 dict 時記錄各預篩階段的頁數"""
     print(str_line('2.比對檔案分割點'))
 
-    max_processes = config.get("max_processes")
-    if max_processes is None:
-        max_processes = max(1, multiprocessing.cpu_count() - 1)
+    max_processes = get_max_processes(config)
 
-    threshold = config["sift_threshold"]
     pdf_path = config["cleaned_pdf"]
 
     similar_pages = []  # 存放有相似圖片的頁碼
@@ -211,23 +488,45 @@ def compare_image_with_pdf_pages_multiprocessing(image_paths, config):
     with fitz.open(pdf_path) as doc:
         total_pages = doc.page_count
 
-    with ProcessPoolExecutor(max_workers=max_processes) as executor:
+    template_features = load_template_features(image_paths, config)
+
+    with ProcessPoolExecutor(max_workers=max_processes, initializer=init_stamp_worker,
+                             initargs=(template_features,)) as executor:
         tasks = [
-            executor.submit(compare_image_with_pdf_page, image_paths, pdf_path, page_num, threshold)
+            executor.submit(compare_image_with_pdf_page, image_paths, pdf_path, page_num, config)
             for page_num in range(total_pages)
         ]
 
+        stages = []
         for future in tasks:
-            page_num, is_similar = future.result()
+            page_num, is_similar, stage = future.result()
+            stages.append(stage)
             if is_similar:
                 similar_pages.append(page_num)
 
+    print_stamp_stats(stages)
+    if stats is not None:
+        stats.update(Counter(stages))
     return similar_pages
 
 
+def split_ranges(page_count, split_points):
+    """由分割點產生各份文件的頁碼區段 [(起始, 結束), ...]"""
+    ranges = []
+    start_page = 0
+    for split_point in split_points:
+        ranges.append((start_page, split_point))
+        start_page = split_point + 1
+
+    # 處理最後一個部分
+    if start_page < page_count:
+        ranges.append((start_page, page_count - 1))
+    return ranges
+
+
 def split_pdf(pdf_path, split_points, output_dir="split_pdf"):
     """
-    將 PDF 分割成多個檔案。
+    將 PDF 分割成多個檔案，每份文件以頁碼區段一次複製。
 
     Args:
         pdf_path: PDF 路徑。
@@ -235,39 +534,375 @@ def split_pdf(pdf_path, split_points, output_dir="split_pdf"):
         output_dir: 輸出目錄，預設為 "split_pdf"。
     """
     print(str_line('3.分割檔案'))
+    try:
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+        ranges = split_ranges(page_count, split_points)
+        write_split_documents(pdf_path, [list(range(start, end + 1)) for start, end in ranges], output_dir)
+
+    except Exception as e:
+        print(f"分割時遇到錯誤: {e}")
+
+
+def get_split_points(similar_pages):
+    """由相似頁碼產生分割點"""
+    similar_pages = sorted(similar_pages)  # 保險起見，確保頁碼順序
+    split_points = []
+
+    for i in range(len(similar_pages) - 1):
+        if similar_pages[i + 1] - similar_pages[i] >= 1:
+            split_points.append(similar_pages[i])
+
+    if similar_pages and similar_pages[-1] not in split_points:
+        split_points.append(similar_pages[-1])
+
+    return split_points
+
+
+def print_split_result(similar_pages, split_points):
+    split_file_count = len(split_points) if split_points else 1
+
+    print("分割結果：")
+    print("-" * 50)
+    print(f"{'頁面':<10}{'已分割檔案'}")
+    print("-" * 50)
+
+    for i, page_num in enumerate(similar_pages):
+        print(f"Page {page_num + 1:<6}→     {i + 1}/{split_file_count}")
+
+
+def page_runs(pages):
+    """將排序後的頁碼整理成連續區段 [(起始, 結束), ...]"""
+    runs = []
+    for page_num in pages:
+        if runs and page_num == runs[-1][1] + 1:
+            runs[-1][1] = page_num
+        else:
+            runs.append([page_num, page_num])
+    return [tuple(run) for run in runs]
+
+
+def write_split_documents(pdf_path, documents, output_dir="split_pdf"):
+    """依每份文件的原始頁碼清單輸出分割檔，連續頁面以區段一次複製"""
     if not os.path.exists(output_dir):
-        os.makedirs(output_dir)  # 建立輸出目錄
+        os.makedirs(output_dir)
 
-    try:
-        doc = fitz.open(pdf_path)
-        start_page = 0
+    with fitz.open(pdf_path) as doc:
+        for i, pages in enumerate(documents):
+            with span("split", document=f"split_{i + 1}.pdf", pages=len(pages)):
+                new_doc = fitz.open()
+                for start, end in page_runs(pages):
+                    new_doc.insert_pdf(doc, from_page=start, to_page=end)
+                new_doc.save(os.path.join(output_dir, f"split_{i + 1}.pdf"))
+                new_doc.close()
 
-        for i, split_point in enumerate(split_points):
-            new_doc = fitz.open()  # 建立新的 PDF 文件
-            for page_num in range(start_page, split_point + 1):
-                new_doc.insert_pdf(doc, from_page=page_num, to_page=page_num)  # 複製頁面
 
-            output_path = os.path.join(output_dir, f"split_{i + 1}.pdf")
-            new_doc.save(output_path)  # 儲存分割後的 PDF
-            new_doc.close()
+def start_split_writer(pdf_path, documents, output_dir="split_pdf", executor=None):
+    """
+    在背景寫出分割檔（供人工核對的存檔），不佔用擷取流程。
 
-            start_page = split_point + 1
+    有處理程序池時交給池中的 worker（批次模式的執行緒不宜再 fork 行程），否則另開一個行程。
+    """
+    if executor is not None:
+        return executor.submit(write_split_documents, pdf_path, documents, output_dir)
+    writer = multiprocessing.Process(target=write_split_documents, args=(pdf_path, documents, output_dir))
+    writer.start()
+    return writer
 
-        # 處理最後一個部分
-        if start_page < doc.page_count:
-            new_doc = fitz.open()
-            for page_num in range(start_page, doc.page_count):
-                new_doc.insert_pdf(doc, from_page=page_num, to_page=page_num)
 
-            output_path = os.path.join(output_dir, f"split_{len(split_points) + 1}.pdf")
-            new_doc.save(output_path)
-            new_doc.close()
+def finish_split_writer(writer):
+    """等待背景寫檔結束，成功時回傳 True"""
+    if writer is None:
+        return False
+    if isinstance(writer, Future):
+        try:
+            writer.result()
+        except Exception as e:
+            print(f"分割時遇到錯誤: {e}")
+            return False
+        print("PDF 分割檔已寫出！")
+        return True
+    writer.join()
+    if writer.exitcode == 0:
+        print("PDF 分割檔已寫出！")
+        return True
+    print(f"分割時遇到錯誤（背景寫檔結束代碼 {writer.exitcode}）")
+    return False
+
+
+def analyze_page_single_pass(image_paths, pdf_path, page_num, config, known=None):
+    """
+    單次渲染分析一頁：空白判斷、大印比對、OCR 共用同一份影像。
 
-    except Exception as e:
-        print(f"分割時遇到錯誤: {e}")
+    無文字層的頁面以第一輪 OCR 的 dpi 渲染一次（見 view_render_dpi），空白判斷與大印比對
+    使用由同一份影像縮小而成的 72 dpi 版本；有文字層的頁面只需 72 dpi。
+    記憶體預算模式下先以 72 dpi 判斷，確定需要 OCR 時才渲染灰階的 OCR 影像。
+    開啟 adaptive_ocr 時 OCR 先以 ocr_low_dpi 辨識，不合格才以 dpi 重新渲染。
+    開啟 preprocess 時無文字層的頁面只前處理一次：轉正裁邊後的影像縮小後供空白判斷與大印比對，
+    二值化影像供 OCR（記憶體預算模式下只用於 OCR）。
+    known 為檢查點中仍有效的階段結果（見 JobManifest.known_page_stages），這些階段不再重算；
+    空白判斷與大印比對的影像不論 OCR 是否已有結果都以相同方式產生，續跑與重新執行的判斷一致。
+
+    Returns:
+        dict: page_num, is_blank, is_similar, stamp_stage, text；有進行 OCR 時另含 ocr_escalated
+    """
+    known = known or {}
+    base_dpi = 72
+    with fitz.open(pdf_path) as doc:
+        page = doc[page_num]
+        text = page.get_text("text")
+        has_text = bool(text.strip())
+        need_ocr = not has_text and "ocr" not in known
+        need_view = "stamp" not in known or (not has_text and "blank" not in known)
+        is_color = page_is_color_scan(page)
+        cache_key = ocr_cache_key(page, config) if need_ocr and config.get("ocr_cache", False) else None
+        img = view = None
+        if has_text or memory_budget_enabled(config):
+            if need_view:
+                view = render_page_array(page, dpi=base_dpi)
+        elif need_view or need_ocr:
+            dpi = view_render_dpi(config)
+            img = render_page_array(page, dpi=dpi)
+            clean = img
+            if preprocess_enabled(config):
+                with span("preprocess", page=page_num):
+                    clean, img = preprocess_image(img, config)
+            if need_view and dpi != base_dpi:
+                scale = base_dpi / dpi
+                view = cv2.resize(clean, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            elif need_view:
+                view = clean
+            del clean
+            if not need_ocr:
+                img = None
+
+    result = {"page_num": page_num, "is_blank": False, "is_similar": False, "stamp_stage": None, "text": ""}
+    if not has_text:
+        if "blank" in known:
+            result["is_blank"] = known["blank"]
+        else:
+            with span("blank_check", page=page_num):
+                result["is_blank"] = is_blank_image(view, config["blank_page_threshold"], config["std_threshold"])
+        if result["is_blank"]:
+            return result
+
+    if "stamp" in known:
+        result["is_similar"], result["stamp_stage"] = known["stamp"]
+    else:
+        template_features = get_template_features(image_paths, config)
+        with span("stamp_match", page=page_num):
+            result["is_similar"], result["stamp_stage"] = detect_stamp(view, is_color, template_features, config)
+
+    if not has_text:
+        text = known.get("ocr")
+        if text is None and cache_key:
+            text = ocr_cache_get(cache_key, config)
+        if text is None:
+            ensure_tesseract_path(config)
+
+            def render_full():
+                with fitz.open(pdf_path) as doc:
+                    return prepare_ocr_image(render_ocr_image(doc[page_num], config), config)
+
+            if img is None:
+                del view
+                with fitz.open(pdf_path) as doc:
+                    img = prepare_ocr_image(render_ocr_image(doc[page_num], config, dpi=first_ocr_dpi(config)),
+                                            config)
+            text, result["ocr_escalated"] = ocr_adaptive(img, render_full, config,
+                                                         page=page_num, file=os.path.basename(pdf_path))
+            del img
+            if cache_key:
+                ocr_cache_put(cache_key, text, config)
+    result["text"] = text
+
+    return result
+
+
+def analyze_page_with_memory(image_paths, pdf_path, page_num, config, known=None):
+    """記憶體預算模式：分析一頁並回報這一頁期間 worker 的峰值 RSS（peak_rss_mb）"""
+    reset_peak_rss()
+    result = analyze_page_single_pass(image_paths, pdf_path, page_num, config, known)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def process_pdf_single_pass(pdf_path, image_paths, config, executor=None, save=True, stats=None, skip_ocr=False):
+    """
+    單次渲染流程：每頁只渲染一次，完成移除空白頁、比對分割點、擷取內容。
+
+    不再經過 remove_blank.pdf 與 split_pdf 的寫入再讀取，
+    分割檔仍會輸出到 process_folder 供人工核對。
+    開啟 job_resume 時每頁完成即寫入工作目錄，中斷後從未完成的頁面繼續。
 
+    Args:
+        executor: 共用的 ProcessPoolExecutor（需以 init_stamp_worker 載入模板），未指定時自行建立。
+        save: 是否寫出 output_excel；批次模式由呼叫端合併各 PDF 的結果後再存檔。
+        stats: dict 時記錄移除的頁碼（removed_pages，從 1 開始）、有大印的頁碼（stamp_pages）、
+            各份文件的頁碼（documents）與預篩各階段頁數（stamp_stages），頁碼皆為原始 PDF 的頁碼。
+        skip_ocr: 不做 OCR，只判斷空白頁、大印與分割（量測用，不使用工作目錄）。
+
+    Returns:
+        List[dict]: 各份文件的擷取結果
+    """
+    print(str_line('1.單次渲染分析頁面'))
+
+    with fitz.open(pdf_path) as doc:
+        total_pages = doc.page_count
+
+    job = None
+    if config.get("job_resume", True) and not skip_ocr:
+        prune_job_dirs(config)
+        job = JobManifest(pdf_path, config, image_paths)
+    try:
+        if executor is not None:
+            return process_pdf_pages(pdf_path, image_paths, total_pages, executor, job, config, save, stats,
+                                     skip_ocr)
+
+        template_features = load_template_features(image_paths, config)
+        with ProcessPoolExecutor(max_workers=get_max_processes(config), initializer=init_stamp_worker,
+                                 initargs=(template_features,)) as executor:
+            return process_pdf_pages(pdf_path, image_paths, total_pages, executor, job, config, save, stats,
+                                     skip_ocr)
     finally:
-        doc.close()  # 確保關閉 PDF 文件
+        if job is not None:
+            job.close()
+
+
+def analyze_pages_single_pass(pdf_path, image_paths, total_pages, executor, job, config, show_progress=True,
+                              memory=None, skip_ocr=False):
+    """
+    分析所有頁面；檢查點中已有完整結果的頁面直接沿用，其餘只重算失效的階段（memory 記錄 worker 峰值）。
+    skip_ocr 時（不使用檢查點）OCR 文字一律為空字串。
+    """
+    page_results = []
+    known_stages = {}
+    if job is not None:
+        for page_num in range(total_pages):
+            known = job.known_page_stages(page_num)
+            result = job.page_result(page_num, known)
+            if result is None:
+                known_stages[page_num] = known
+            else:
+                page_results.append(result)
+
+        print(f"工作目錄：{job.job_dir}")
+        changed = job.changed_stages()
+        if changed:
+            print("設定已變更，重新計算：" + "、".join(STAGE_NAMES[stage] for stage in changed))
+        if page_results:
+            print(f"沿用檢查點 {len(page_results)} 頁，需分析 {total_pages - len(page_results)} 頁")
+    else:
+        known_stages = {page_num: {"ocr": ""} if skip_ocr else {} for page_num in range(total_pages)}
+
+    if known_stages:
+        start_time = time.time()
+        analyze = analyze_page_with_memory if memory_budget_enabled(config) else analyze_page_single_pass
+        tasks = [
+            executor.submit(analyze, image_paths, pdf_path, page_num, config, known)
+            for page_num, known in known_stages.items()
+        ]
+        done = 0
+        ocr_pages = escalated_pages = 0
+        for future in as_completed(tasks):
+            result = future.result()
+            if memory is not None:
+                memory.record("分析頁面", "worker", result.pop("peak_rss_mb", None))
+            if "ocr_escalated" in result:
+                ocr_pages += 1
+                escalated_pages += result.pop("ocr_escalated")
+            if job is not None:
+                job.record_page(result)
+            page_results.append(result)
+            done += 1
+            if show_progress:
+                print_progress(done, len(tasks), start_time)
+        if show_progress:
+            print()
+        print_ocr_escalation(ocr_pages, escalated_pages, config)
+    page_results.sort(key=lambda result: result["page_num"])
+    return page_results
+
+
+def process_pdf_pages(pdf_path, image_paths, total_pages, executor, job, config, save=True, stats=None,
+                      skip_ocr=False):
+    memory = MemoryReport(memory_budget_enabled(config))
+    memory.begin("分析頁面")
+    page_results = analyze_pages_single_pass(pdf_path, image_paths, total_pages, executor, job, config,
+                                             show_progress=save, memory=memory, skip_ocr=skip_ocr)
+    memory.end("分析頁面")
+
+    removed_pages = [result["page_num"] + 1 for result in page_results if result["is_blank"]]
+    print_removed_pages(removed_pages, total_pages)
+
+    # 與舊流程相同，分割點以移除空白頁後的頁碼計算
+    kept_results = [result for result in page_results if not result["is_blank"]]
+    similar_pages = [i for i, result in enumerate(kept_results) if result["is_similar"]]
+
+    print(str_line('2.比對檔案分割點'))
+    print_stamp_stats([result["stamp_stage"] for result in kept_results])
+    documents = [[]]
+    if similar_pages:
+        split_points = get_split_points(similar_pages)
+        print_split_result(similar_pages, split_points)
+        split_set = set(split_points)
+        for i, result in enumerate(kept_results):
+            documents[-1].append(result)
+            if i in split_set and i != len(kept_results) - 1:
+                documents.append([])
+    else:
+        print("PDF 中沒有與圖片相似的頁面。")
+        documents[0] = kept_results
+    documents = [document for document in documents if document]
+
+    document_pages = [[result["page_num"] for result in document] for document in documents]
+    if stats is not None:
+        stats.update(removed_pages=removed_pages, documents=document_pages,
+                     stamp_pages=[result["page_num"] for result in kept_results if result["is_similar"]],
+                     stamp_stages=Counter(result["stamp_stage"] for result in kept_results))
+    if job is not None:
+        job.complete_stage("split_points", data={"similar_pages": similar_pages, "documents": document_pages})
+
+    print(str_line('3.分割檔案'))
+    writer = None
+    split_key = fingerprint(document_pages)
+    split_files = [os.path.join(config['process_folder'], f"split_{i + 1}.pdf") for i in range(len(documents))]
+    if (job is not None and job.stage_data("split_files", split_key) is not None
+            and all(os.path.exists(path) for path in split_files)):
+        print("分割檔與上次相同，略過寫檔")
+    elif config.get("write_split_files", True):
+        writer = start_split_writer(pdf_path, document_pages, config['process_folder'], executor)
+    print(f"共 {len(documents)} 份文件")
+
+    print(str_line('4.擷取文件內工廠編號'))
+    memory.begin("擷取")
+    extract_key = fingerprint([[result["text"] for result in document] for document in documents])
+    saved = job.stage_data("extract", extract_key) if job is not None else None
+    if saved is not None:
+        extracted_data = saved["rows"]
+        print(f"擷取結果與上次相同，沿用 {len(extracted_data)} 筆")
+    else:
+        extracted_data = []
+        for i, document in enumerate(documents):
+            with span("extract", document=f"split_{i + 1}.pdf", file=os.path.basename(pdf_path)):
+                data = extract_text_data(join_page_texts([result["text"] for result in document]), config)
+            data["檔名"] = f"split_{i + 1}.pdf"
+            extracted_data.append(data)
+            print(f"Processed: {data['檔名']}")
+        if job is not None:
+            job.complete_stage("extract", extract_key, {"rows": [dict(data) for data in extracted_data]})
+    memory.end("擷取")
+
+    if save:
+        memory.begin("存檔")
+        save_extraction_results(extracted_data, config['output_excel'])
+        prune_ocr_cache(config)
+        memory.end("存檔")
+    if finish_split_writer(writer) and job is not None:
+        job.complete_stage("split_files", split_key)
+    memory.print_report()
+    return extracted_data
+
 
 def get_images_from_folder(folder_path, extensions=('.jpg', '.jpeg', '.png', '.bmp')):
     image_paths = []
@@ -342,7 +977,7 @@ def show_manual_step(root, config):
     def on_yes():
         root.destroy()  # 關閉目前提示視窗
         print(str_line('5.查詢工廠編號'))
-        process_excel_data(output_excel, 4)
+        process_excel_data(output_excel, 4, config, split_numbers=True)  # 沒有人工只留一個編號的步驟
         os.startfile(output_excel)
         show_finish_window()
 
@@ -379,6 +1014,173 @@ def show_finish_window():
 
 
 
+def collect_pdf_paths(inputs):
+    """展開命令列輸入：PDF 檔案，或資料夾內的 PDF（不含子資料夾）"""
+    pdf_paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            pdf_paths += [os.path.join(item, name) for name in sorted(os.listdir(item))
+                          if name.lower().endswith(".pdf") and os.path.isfile(os.path.join(item, name))]
+        elif item.lower().endswith(".pdf") and os.path.isfile(item):
+            pdf_paths.append(item)
+        else:
+            print(f"[警告] 略過非 PDF 輸入：{item}")
+    return list(dict.fromkeys(os.path.abspath(path) for path in pdf_paths))
+
+
+def make_batch_dir(config):
+    """每個批次一個輸出資料夾 batch_output_dir/<日期_時間>"""
+    base = os.path.join(config.get("batch_output_dir", "batch_output"), time.strftime("%Y%m%d_%H%M%S"))
+    output_dir, suffix = base, 1
+    while os.path.exists(output_dir):
+        suffix += 1
+        output_dir = f"{base}_{suffix}"
+    os.makedirs(output_dir)
+    return output_dir
+
+
+def process_pdf_in_batch(pdf_path, name, image_paths, config, executor, output_dir):
+    """批次中的一份 PDF：分割檔寫到批次資料夾下的 <name>，檔名欄加上來源名稱"""
+    pdf_config = dict(config, process_folder=os.path.join(output_dir, name))
+    extracted_data = process_pdf_single_pass(pdf_path, image_paths, pdf_config, executor, save=False)
+    return [dict(data, 檔名=f"{name}/{data['檔名']}") for data in extracted_data]
+
+
+def run_batch(pdf_paths, image_paths, config, executor, lookup=False):
+    """
+    不經對話框處理一批 PDF，所有頁面共用同一個處理程序池，結果合併成一個 Excel。
+
+    Returns:
+        (Excel 路徑, 處理失敗的 PDF 清單)
+    """
+    output_dir = make_batch_dir(config)
+    output_excel = os.path.join(output_dir, os.path.basename(config["output_excel"]))
+    print(str_line(f'批次處理 {len(pdf_paths)} 份 PDF'))
+
+    # 同名的 PDF 加上序號，避免分割檔互相覆蓋
+    names, used = {}, Counter()
+    for pdf_path in pdf_paths:
+        stem = os.path.splitext(os.path.basename(pdf_path))[0]
+        used[stem] += 1
+        names[pdf_path] = stem if used[stem] == 1 else f"{stem}_{used[stem]}"
+
+    extracted_data, failed = [], []
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, config.get("batch_concurrency", 2))) as pdf_executor:
+        futures = {
+            pdf_executor.submit(process_pdf_in_batch, pdf_path, names[pdf_path], image_paths, config,
+                                executor, output_dir): pdf_path
+            for pdf_path in pdf_paths
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            pdf_path = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                failed.append(pdf_path)
+                print(f"[錯誤] {pdf_path} 處理失敗：{e}")
+                continue
+            extracted_data += rows
+            print(f"完成 {done}/{len(pdf_paths)}：{os.path.basename(pdf_path)}（{len(rows)} 份文件）")
+
+    save_extraction_results(extracted_data, output_excel)
+    prune_ocr_cache(config)
+    print(f"批次完成：{len(pdf_paths) - len(failed)} 份成功，{len(failed)} 份失敗，"
+          f"耗時 {time.time() - start_time:.1f} 秒")
+
+    if lookup and extracted_data:
+        print(str_line('5.查詢工廠編號'))
+        process_excel_data(output_excel, 4, config, split_numbers=True)  # 沒有人工只留一個編號的步驟
+    return output_excel, failed
+
+
+def move_to_folder(path, folder):
+    """移到 folder，已有同名檔案時在檔名前加上時間"""
+    os.makedirs(folder, exist_ok=True)
+    target = os.path.join(folder, os.path.basename(path))
+    if os.path.exists(target):
+        target = os.path.join(folder, f"{time.strftime('%Y%m%d_%H%M%S')}_{os.path.basename(path)}")
+    shutil.move(path, target)
+
+
+def watch_folder(inbox, image_paths, config, executor, lookup=False):
+    """
+    監看收件資料夾，新的掃描檔寫入完成後（連續兩次檢查大小不變）整批處理。
+
+    處理完的 PDF 移到 inbox/done，失敗的移到 inbox/failed；每批輸出一個 Excel。
+    整批失敗（例如 Excel 無法存檔）時該批全部移到 inbox/failed，繼續監看。
+    """
+    interval = config.get("watch_interval", 10)
+    done_dir = os.path.join(inbox, "done")
+    failed_dir = os.path.join(inbox, "failed")
+    os.makedirs(inbox, exist_ok=True)
+    print(f"監看資料夾：{inbox}（每 {interval} 秒檢查一次，按 Ctrl+C 結束）")
+
+    sizes = {}
+    while True:
+        current, ready = {}, []
+        for name in sorted(os.listdir(inbox)):
+            path = os.path.join(inbox, name)
+            if not name.lower().endswith(".pdf") or not os.path.isfile(path):
+                continue
+            current[path] = os.path.getsize(path)
+            if sizes.get(path) == current[path]:
+                ready.append(path)
+        sizes = current
+
+        if ready:
+            try:
+                _, failed = run_batch(ready, image_paths, config, executor, lookup)
+            except Exception as e:
+                failed = ready
+                print(f"[錯誤] 批次處理失敗，{len(ready)} 份 PDF 移到 {failed_dir}：{type(e).__name__}: {e}")
+            for path in ready:
+                try:
+                    move_to_folder(path, failed_dir if path in failed else done_dir)
+                except OSError as e:
+                    print(f"[錯誤] 無法移動 {path}：{e}")
+                sizes.pop(path, None)
+            export_trace(clear=True)  # 每批各自一份追蹤檔與摘要
+            print(f"繼續監看：{inbox}")
+        time.sleep(interval)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="工廠登記公文自動化處理（不帶參數時開啟互動流程）")
+    parser.add_argument("inputs", nargs="*", help="要處理的 PDF 檔案或資料夾")
+    parser.add_argument("--watch", metavar="資料夾", help="監看收件資料夾，持續處理新放入的 PDF")
+    parser.add_argument("--lookup", action="store_true", help="擷取後直接查詢工廠編號")
+    parser.add_argument("--config", default="config.json", help="設定檔路徑")
+    return parser.parse_args(argv)
+
+
+def run_headless(args):
+    """命令列批次／監看模式：不開對話框，也不自動開啟 Excel；一律使用單次渲染流程"""
+    config = load_config(args.config)
+    if not config.get("single_pass", True):
+        print("[提示] 命令列批次／監看模式一律使用單次渲染流程，single_pass 設定只影響互動流程。")
+    start_trace(config)
+    image_paths = get_images_from_folder(config['image_folder'])
+    template_features = load_template_features(image_paths, config)
+
+    with ProcessPoolExecutor(max_workers=get_max_processes(config), initializer=init_stamp_worker,
+                             initargs=(template_features,)) as executor:
+        if args.watch:
+            try:
+                watch_folder(args.watch, image_paths, config, executor, args.lookup)
+            except KeyboardInterrupt:
+                print("\n停止監看。")
+            return 0
+
+        pdf_paths = collect_pdf_paths(args.inputs)
+        if not pdf_paths:
+            print("[錯誤] 沒有可處理的 PDF。")
+            return 1
+        _, failed = run_batch(pdf_paths, image_paths, config, executor, args.lookup)
+    export_trace()
+    return 1 if failed else 0
+
+
 def main ():
     print_intro()
     
@@ -400,61 +1202,70 @@ def main ():
 
     #config = load_config(default_config=default_config)
     config = load_config()
+    start_trace(config)
     
     if_split = check_and_handle_split_folder(config)
 
     if if_split == 'y':
         pdf_path = select_pdf()
 
-        remove_blank_pages(pdf_path, config)
-        wait_for_file(config["cleaned_pdf"])
-        temp_path = config["cleaned_pdf"]
-
         image_folder = config['image_folder']  # 假設你的圖片都放在 templates 資料夾內
         image_paths = get_images_from_folder(image_folder)
 
-        similar_pages = compare_image_with_pdf_pages_multiprocessing(image_paths, config)  # 已回傳 List[int]
-
-        if similar_pages:
-            similar_pages.sort()  # 保險起見，確保頁碼順序
-            split_points = []
-
-            for i in range(len(similar_pages) - 1):
-                if similar_pages[i + 1] - similar_pages[i] >= 1:
-                    split_points.append(similar_pages[i])
-
-            if similar_pages[-1] not in split_points:
-                split_points.append(similar_pages[-1])
-
-            split_file_count = len(split_points) if split_points else 1
-
-            print("分割結果：")
-            print("-" * 50)
-            print(f"{'頁面':<10}{'已分割檔案'}")
-            print("-" * 50)
-
-            for i, page_num in enumerate(similar_pages):
-                print(f"Page {page_num + 1:<6}→     {i + 1}/{split_file_count}")
-
-            split_pdf(temp_path, split_points)
-            print("PDF 分割完成！")
+        if config.get("single_pass", True):
+            process_pdf_single_pass(pdf_path, image_paths, config)
         else:
-            print("PDF 中沒有與圖片相似的頁面。")
+            remove_blank_pages(pdf_path, config)
+            wait_for_file(config["cleaned_pdf"])
+            temp_path = config["cleaned_pdf"]
 
-        
-        # 清理暫存檔案 (可選)
-        if config['clean_temp_pdf']:
-            os.remove(config["cleaned_pdf"])
+            similar_pages = compare_image_with_pdf_pages_multiprocessing(image_paths, config)  # 已回傳 List[int]
 
+            if similar_pages:
+                similar_pages.sort()  # 保險起見，確保頁碼順序
+                split_points = get_split_points(similar_pages)
+                print_split_result(similar_pages, split_points)
+            else:
+                split_points = []
+                print("PDF 中沒有與圖片相似的頁面。")
+
+            if config.get("virtual_split", True):
+                # 直接以頁碼區段擷取，分割檔只在背景寫出供存檔
+                print(str_line('3.分割檔案'))
+                with fitz.open(temp_path) as doc:
+                    ranges = split_ranges(doc.page_count, split_points)
+                writer = None
+                if config.get("write_split_files", True):
+                    writer = start_split_writer(temp_path, [list(range(start, end + 1)) for start, end in ranges],
+                                                config['process_folder'])
+
+                print(str_line('4.擷取文件內工廠編號'))
+                process_page_ranges_multiprocessing(temp_path, ranges, config)
+                finish_split_writer(writer)
+            else:
+                if similar_pages:
+                    split_pdf(temp_path, split_points)
+                    print("PDF 分割完成！")
 
-    print(str_line('4.擷取文件內工廠編號'))
-    process_folder_multiprocessing(config)
+                print(str_line('4.擷取文件內工廠編號'))
+                process_folder_multiprocessing(config)
+
+            # 清理暫存檔案 (可選)
+            if config['clean_temp_pdf']:
+                os.remove(config["cleaned_pdf"])
+    else:
+        print(str_line('4.擷取文件內工廠編號'))
+        process_folder_multiprocessing(config)
 
     os.startfile(config['output_excel'])
     
     show_manual_step(tk.Tk(), config)
+    export_trace()
 
 # 範例
 if __name__ == '__main__':
     multiprocessing.freeze_support()
+    args = parse_args()
+    if args.inputs or args.watch:
+        sys.exit(run_headless(args))
     main()
\ No newline at end of file
@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+import time
+
+
+"""
+各階段計時（config.json 的 trace 開啟時才記錄）
+
+  with span("ocr", page=3):
+      ...
+
+每個行程把 span 逐行寫入 trace_dir/<執行時間>/spans_<pid>.jsonl；
+export_trace() 合併成 Chrome 追蹤檔 trace.json（chrome://tracing 或 https://ui.perfetto.dev 開啟），
+並列出各階段的次數、p50、p95 與每秒處理量。
+監看模式每批以 export_trace(clear=True) 輸出到 trace_dir/<執行時間>/<批次時間>，並清空已讀取的 span，
+各批的摘要只包含該批，span 檔也不會持續變大。
+
+追蹤資料夾以環境變數傳給 worker（Windows 的 spawn 行程也能繼承），未開啟時 span() 只回傳共用的空物件。
+"""
+
+
+TRACE_ENV = "FACTORY_TRACE_DIR"
+
+_TRACE_DIR = os.environ.get(TRACE_ENV) or None
+_TRACE_FILE = None
+_TRACE_PID = None
+_TRACE_LOCK = threading.Lock()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "args", "ts", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.ts = time.time_ns() // 1000
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = int((time.perf_counter() - self.start) * 1e6)
+        thread = threading.current_thread()
+        write_span({"name": self.name, "ts": self.ts, "dur": duration, "pid": os.getpid(),
+                    "tid": thread.native_id, "args": dict(self.args, thread=thread.name)})
+        return False
+
+
+def span(name, **args):
+    """計時區塊；未開啟追蹤時幾乎沒有額外成本"""
+    if _TRACE_DIR is None:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def write_span(event):
+    global _TRACE_FILE, _TRACE_PID
+    line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+    with _TRACE_LOCK:
+        if _TRACE_PID != event["pid"]:
+            # fork 出來的行程不沿用父行程的檔案
+            os.makedirs(_TRACE_DIR, exist_ok=True)
+            # 逐行寫入，worker 被結束時也不會遺失已完成的 span
+            _TRACE_FILE = open(os.path.join(_TRACE_DIR, f"spans_{event['pid']}.jsonl"), "a",
+                               encoding="utf-8", buffering=1)
+            _TRACE_PID = event["pid"]
+        _TRACE_FILE.write(line)
+
+
+def start_trace(config):
+    """依 config 的 trace 開啟追蹤（需在建立處理程序池之前呼叫），回傳追蹤資料夾或 None"""
+    global _TRACE_DIR
+    if not config.get("trace", False):
+        return None
+    if _TRACE_DIR is None:
+        _TRACE_DIR = os.path.join(config.get("trace_dir", "traces"), time.strftime("%Y%m%d_%H%M%S"))
+        os.makedirs(_TRACE_DIR, exist_ok=True)
+        os.environ[TRACE_ENV] = _TRACE_DIR
+    return _TRACE_DIR
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(events):
+    """各階段：次數、總耗時、p50、p95（毫秒）與每秒處理量（以該階段第一筆開始到最後一筆結束計）"""
+    stages = {}
+    for event in events:
+        stages.setdefault(event["name"], []).append(event)
+
+    summary = {}
+    for name, items in stages.items():
+        durations = sorted(item["dur"] / 1000 for item in items)
+        wall = (max(item["ts"] + item["dur"] for item in items) - min(item["ts"] for item in items)) / 1e6
+        summary[name] = {
+            "count": len(items),
+            "total_s": round(sum(durations) / 1000, 3),
+            "p50_ms": round(percentile(durations, 0.5), 2),
+            "p95_ms": round(percentile(durations, 0.95), 2),
+            "per_sec": round(len(items) / wall, 2) if wall > 0 else None,
+        }
+    return summary
+
+
+def read_spans(path, clear=False):
+    """讀取一個行程的 span；clear 時讀完即清空（worker 以附加模式寫入，之後的 span 從頭寫起）"""
+    with open(path, "r+", encoding="utf-8") as f:
+        lines = f.readlines()
+        if clear:
+            f.seek(0)
+            f.truncate()
+    events = []
+    for line in lines:
+        try:
+            events.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return events
+
+
+def export_trace(trace_dir=None, clear=False):
+    """
+    合併各行程的 span，寫出 trace.json 與 summary.json 並列出摘要；未開啟追蹤時不做事。
+
+    clear 為 True 時輸出到 trace_dir 下以目前時間命名的子資料夾，並清空已讀取的 span（監看模式每批一次）。
+    """
+    trace_dir = trace_dir or _TRACE_DIR
+    if trace_dir is None or not os.path.isdir(trace_dir):
+        return None
+
+    events = []
+    for filename in sorted(os.listdir(trace_dir)):
+        if filename.startswith("spans_") and filename.endswith(".jsonl"):
+            events += read_spans(os.path.join(trace_dir, filename), clear)
+    if not events:
+        return None
+
+    if clear:
+        base = os.path.join(trace_dir, time.strftime("%Y%m%d_%H%M%S"))
+        trace_dir, suffix = base, 1
+        while os.path.exists(trace_dir):
+            suffix += 1
+            trace_dir = f"{base}_{suffix}"
+        os.makedirs(trace_dir)
+
+    trace_events = [dict(event, ph="X", cat="pipeline") for event in sorted(events, key=lambda e: e["ts"])]
+    with open(os.path.join(trace_dir, "trace.json"), "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+    summary = summarize(events)
+    with open(os.path.join(trace_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    print(f"\n效能追蹤：{os.path.join(trace_dir, 'trace.json')}")
+    print(f"{'階段':<18}{'次數':>8}{'總耗時(s)':>12}{'p50(ms)':>10}{'p95(ms)':>10}{'每秒':>10}")
+    for name, row in sorted(summary.items(), key=lambda item: -item[1]["total_s"]):
+        per_sec = "" if row["per_sec"] is None else row["per_sec"]
+        print(f"{name:<18}{row['count']:>8}{row['total_s']:>12}{row['p50_ms']:>10}{row['p95_ms']:>10}{per_sec:>10}")
+    return summary